@@ -0,0 +1,225 @@
+import copy
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.db.models import BooleanField, Value
+from django.http import HttpResponse, HttpResponseNotModified
+from django_filters.widgets import BooleanWidget
+from rest_framework.authentication import get_authorization_header
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from api.authentication import CachedTokenAuthentication, token_cache
+from api.mixins import catalog_headers, catalog_key, catalog_not_modified
+from api.pagination import CustomPaginator
+from api.serializers import RecipeGetSerializer, SubscribeSerializer
+from recipes.models import Recipe, Tag, User
+from recipes.versions import aget_catalog_version
+
+RECIPE_LIST_PARAMS = {'page', 'limit', 'tags', 'author', 'is_favorited',
+                      'is_in_shopping_cart', 'ordering'}
+SUBSCRIPTIONS_PARAMS = {'page', 'limit', 'recipes_limit'}
+
+
+def local_user(request):
+    """Пользователь без запроса к БД: аноним или токен из кэша процесса.
+
+    None, если токена в кэше нет: тогда запрос идёт через DRF, чтобы
+    неверный токен получил 401.
+    """
+    auth = get_authorization_header(request).split()
+    if not auth:
+        return AnonymousUser()
+    if (len(auth) != 2 or auth[0].lower()
+            != CachedTokenAuthentication.keyword.lower().encode()):
+        return None
+    user = token_cache.get_local(auth[1].decode(errors='replace'))
+    if user is None or not user.is_active:
+        return None
+    return copy.copy(user)
+
+
+def json_requested(request, params=None):
+    """GET за JSON, и все параметры запроса из params.
+
+    Остальное (формы DRF, HEAD, незнакомые параметры) обрабатывает
+    обычный viewset.
+    """
+    return (request.method == 'GET'
+            and request.GET.get('format', 'json') == 'json'
+            and 'text/html' not in request.headers.get('Accept', '')
+            and (params is None or set(request.GET) <= params))
+
+
+def json_response(data, headers=None):
+    headers = {'Vary': 'Accept', **(headers or {})}
+    return HttpResponse(JSONRenderer().render(data),
+                        content_type=JSONRenderer.media_type,
+                        headers=headers)
+
+
+async def paginate(request, queryset):
+    """Страница queryset как у CustomPaginator.
+
+    None, если номер страницы разбирает DRF (ошибка или 'last').
+    """
+    paginator = CustomPaginator()
+    page = request.GET.get(paginator.page_query_param, '1')
+    if not page.isdigit() or int(page) < 1:
+        return None
+    page = int(page)
+    size = paginator.get_page_size(Request(request))
+    count = await queryset.acount()
+    offset = (page - 1) * size
+    if page > 1 and offset >= count:
+        return None
+    items = [item async for item in queryset[offset:offset + size]]
+    url = request.build_absolute_uri()
+    previous = None
+    if page == 2:
+        previous = remove_query_param(url, paginator.page_query_param)
+    elif page > 2:
+        previous = replace_query_param(url, paginator.page_query_param,
+                                       page - 1)
+    return items, {
+        'count': count,
+        'next': (replace_query_param(url, paginator.page_query_param,
+                                     page + 1)
+                 if offset + size < count else None),
+        'previous': previous,
+    }
+
+
+async def cached_catalog_response(request, **kwargs):
+    """Ответ справочника из кэша без перехода в синхронный поток.
+
+    None, если ответа в кэше нет или нужен не JSON.
+    """
+    if (request.method not in ('GET', 'HEAD')
+            or request.GET.get('format', 'json') != 'json'
+            or 'text/html' in request.headers.get('Accept', '')
+            or local_user(request) is None):
+        return None
+    version = await aget_catalog_version()
+    headers = catalog_headers(version, JSONRenderer.format)
+    headers['Vary'] = 'Accept'
+    if catalog_not_modified(request, headers):
+        response = HttpResponseNotModified()
+        for header, value in headers.items():
+            response[header] = value
+        return response
+    data = await cache.aget(catalog_key(version, request))
+    if data is None:
+        return None
+    return json_response(data, headers)
+
+
+async def filter_recipes(request, user):
+    """Рецепты по параметрам RecipeFilter.
+
+    None, если параметры не проходят проверку: ошибку вернёт DRF.
+    """
+    recipes = Recipe.objects.all()
+    params = request.GET
+    slugs = set(params.getlist('tags'))
+    if slugs:
+        tags = [tag async for tag in Tag.objects.all()]
+        selected = [tag for tag in tags if tag.slug in slugs]
+        if len(selected) != len(slugs):
+            return None
+        recipes = recipes.with_tags(selected,
+                                    max(tag.mask for tag in tags))
+    author = params.get('author')
+    if author:
+        if (not author.isdigit()
+                or not await User.objects.filter(pk=author).aexists()):
+            return None
+        recipes = recipes.filter(author=author)
+    widget = BooleanWidget()
+    if user.is_authenticated:
+        if widget.value_from_datadict(params, {}, 'is_favorited'):
+            recipes = recipes.favorited_by(user)
+        if widget.value_from_datadict(params, {}, 'is_in_shopping_cart'):
+            recipes = recipes.in_shopping_cart_of(user)
+    ordering = params.get('ordering')
+    if not ordering:
+        return recipes
+    if ordering != 'popular':
+        return None
+    return recipes.popular()
+
+
+async def recipe_list_response(request):
+    """Список рецептов с фильтрами и постраничной пагинацией."""
+    user = local_user(request)
+    if user is None or not json_requested(request, RECIPE_LIST_PARAMS):
+        return None
+    recipes = await filter_recipes(request, user)
+    if recipes is None:
+        return None
+    page = await paginate(
+        request, recipes.select_related('author').with_user_flags(user))
+    if page is None:
+        return None
+    recipes, data = page
+    serializer = RecipeGetSerializer(context={'request': request})
+    data['results'] = await serializer.arepresent(recipes)
+    return json_response(data)
+
+
+async def recipe_detail_response(request, pk):
+    user = local_user(request)
+    if user is None or not json_requested(request):
+        return None
+    recipe = await (Recipe.objects.filter(pk=pk).select_related('author')
+                    .with_user_flags(user).afirst())
+    if recipe is None:
+        return None
+    serializer = RecipeGetSerializer(context={'request': request})
+    return json_response((await serializer.arepresent([recipe]))[0])
+
+
+async def subscriptions_response(request):
+    """Подписки текущего пользователя с рецептами авторов."""
+    user = local_user(request)
+    if (user is None or not user.is_authenticated
+            or not json_requested(request, SUBSCRIPTIONS_PARAMS)):
+        return None
+    page = await paginate(request, User.objects.filter(
+        subscribing__user=user,
+    ).annotate(is_subscribed=Value(True, output_field=BooleanField())))
+    if page is None:
+        return None
+    authors, data = page
+    recipes = Recipe.objects.filter(author__in=authors)
+    limit = request.GET.get('recipes_limit')
+    if limit and limit.isdigit():
+        recipes = recipes.latest_per_author(int(limit))
+    by_author = {author.pk: [] for author in authors}
+    async for recipe in recipes:
+        by_author[recipe.author_id].append(recipe)
+    for author in authors:
+        author.limited_recipes = by_author[author.pk]
+    data['results'] = SubscribeSerializer(
+        authors, many=True, context={'request': request}).data
+    return json_response(data)
+
+
+def async_view(viewset, actions, handler):
+    """Асинхронный view для ASGI.
+
+    handler отвечает сам через async ORM и кэш или возвращает None,
+    тогда запрос обрабатывает обычный viewset в синхронном потоке.
+    """
+    sync_view = sync_to_async(viewset.as_view(actions))
+
+    async def view(request, *args, **kwargs):
+        response = await handler(request, *args, **kwargs)
+        if response is not None:
+            return response
+        return await sync_view(request, *args, **kwargs)
+
+    view.csrf_exempt = True
+    return view
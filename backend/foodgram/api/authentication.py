@@ -0,0 +1,115 @@
+import copy
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from django.core.cache import caches
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.permissions import SAFE_METHODS
+
+from foodgram.settings import (TOKEN_CACHE_SHARED, TOKEN_CACHE_SIZE,
+                               TOKEN_CACHE_TIMEOUT)
+
+
+class TokenCache:
+    """Кэш token -> пользователь в памяти процесса.
+
+    Хранит не больше size записей (вытесняются давно не использованные)
+    и не дольше timeout секунд. Если задан shared - псевдоним кэша
+    Django, промахи ищутся в нём, а удаление сбрасывает обе копии.
+    """
+
+    def __init__(self, size, timeout, shared=None):
+        self.size = size
+        self.timeout = timeout
+        self.shared = shared
+        self.items = OrderedDict()
+        self.lock = Lock()
+
+    def shared_cache(self):
+        return caches[self.shared] if self.shared else None
+
+    @staticmethod
+    def shared_key(key):
+        return f'token:{key}'
+
+    def get_local(self, key):
+        with self.lock:
+            item = self.items.get(key)
+            if item is not None:
+                user, expires = item
+                if expires > time.monotonic():
+                    self.items.move_to_end(key)
+                    return user
+                del self.items[key]
+        return None
+
+    def get(self, key):
+        user = self.get_local(key)
+        if user is not None:
+            return user
+        shared = self.shared_cache()
+        if shared is None:
+            return None
+        user = shared.get(self.shared_key(key))
+        if user is not None:
+            self.set_local(key, user)
+        return user
+
+    def set(self, key, user):
+        self.set_local(key, user)
+        shared = self.shared_cache()
+        if shared is not None:
+            shared.set(self.shared_key(key), user, self.timeout)
+
+    def set_local(self, key, user):
+        with self.lock:
+            self.items[key] = (user, time.monotonic() + self.timeout)
+            self.items.move_to_end(key)
+            while len(self.items) > self.size:
+                self.items.popitem(last=False)
+
+    def delete(self, *keys):
+        with self.lock:
+            for key in keys:
+                self.items.pop(key, None)
+        shared = self.shared_cache()
+        if shared is not None and keys:
+            shared.delete_many([self.shared_key(key) for key in keys])
+
+
+token_cache = TokenCache(TOKEN_CACHE_SIZE, TOKEN_CACHE_TIMEOUT,
+                         TOKEN_CACHE_SHARED)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication без запроса к БД для недавно виденных токенов.
+
+    Изменения пользователя через djoser (пароль, PATCH /users/me/)
+    сохраняют request.user целиком, для них пользователь читается
+    из БД: копия из кэша перезаписала бы более новые данные.
+    """
+    from_db = False
+
+    def authenticate(self, request):
+        # djoser.views импортирует настройки DRF, а они - этот модуль.
+        from djoser.views import UserViewSet
+
+        self.from_db = (
+            request.method not in SAFE_METHODS
+            and isinstance(request.parser_context.get('view'), UserViewSet))
+        return super().authenticate(request)
+
+    def authenticate_credentials(self, key):
+        # Из кэша отдаётся копия, чтобы атрибуты одного запроса
+        # не попали в другой.
+        user = None if self.from_db else token_cache.get(key)
+        if user is None:
+            user, token = super().authenticate_credentials(key)
+            token_cache.set(key, user)
+            return copy.copy(user), token
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(
+                'User inactive or deleted.')
+        return copy.copy(user), self.get_model()(key=key, user=user)
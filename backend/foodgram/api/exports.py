@@ -0,0 +1,92 @@
+import csv
+import json
+from functools import partial
+from itertools import chain
+from tempfile import SpooledTemporaryFile
+
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+from foodgram.settings import EXPORT_CHUNK_SIZE, PDF_FONT
+from recipes.models import ShoppingListItem
+
+TITLE = 'Чтобы поесть купите следующие продукты:'
+PDF_FONT_NAME = 'ShoppingList'
+PDF_FONT_SIZE = 12
+PDF_MARGIN = 50
+
+
+def shopping_list(user):
+    """Ингредиенты из корзины user: (название, количество, единица)."""
+    return (
+        ShoppingListItem.objects
+        .filter(user=user)
+        .values_list('ingredient__name', 'total_amount',
+                     'ingredient__measurement_unit')
+        .order_by('ingredient__name')
+        .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    )
+
+
+def export_txt(rows):
+    yield TITLE
+    for row in rows:
+        yield '\n{} - {} {}.'.format(*row)
+
+
+class Echo:
+    """Псевдо-буфер для csv.writer: возвращает строку вместо записи."""
+
+    def write(self, value):
+        return value
+
+
+def export_csv(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'amount', 'measurement_unit'))
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def export_json(rows):
+    separator = ''
+    yield '['
+    for name, amount, unit in rows:
+        yield separator + json.dumps(
+            {'name': name, 'amount': amount, 'measurement_unit': unit},
+            ensure_ascii=False
+        )
+        separator = ', '
+    yield ']'
+
+
+def export_pdf(rows):
+    if PDF_FONT_NAME not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(TTFont(PDF_FONT_NAME, PDF_FONT))
+    _, height = A4
+    leading = PDF_FONT_SIZE * 1.5
+    with SpooledTemporaryFile(max_size=EXPORT_CHUNK_SIZE * 1024) as buffer:
+        pdf = canvas.Canvas(buffer, pagesize=A4)
+        pdf.setFont(PDF_FONT_NAME, PDF_FONT_SIZE)
+        y = height - PDF_MARGIN
+        lines = chain((TITLE,), ('{} - {} {}.'.format(*row) for row in rows))
+        for line in lines:
+            if y < PDF_MARGIN:
+                pdf.showPage()
+                pdf.setFont(PDF_FONT_NAME, PDF_FONT_SIZE)
+                y = height - PDF_MARGIN
+            pdf.drawString(PDF_MARGIN, y, line)
+            y -= leading
+        pdf.save()
+        buffer.seek(0)
+        yield from iter(partial(buffer.read, EXPORT_CHUNK_SIZE * 16), b'')
+
+
+EXPORT_FORMATS = {
+    'txt': ('text/plain', export_txt),
+    'csv': ('text/csv', export_csv),
+    'json': ('application/json', export_json),
+    'pdf': ('application/pdf', export_pdf),
+}
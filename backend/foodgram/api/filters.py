@@ -1,29 +1,59 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connections
+from django.db.models import Case, F, IntegerField, Q, Value, When
 from django_filters.rest_framework import FilterSet, filters
 
+from foodgram.settings import SEARCH_CONFIG
 from recipes.models import Recipe, Tag
 
 
 class RecipeFilter(FilterSet):
     tags = filters.ModelMultipleChoiceFilter(field_name='tags__slug',
                                              to_field_name='slug',
-                                             queryset=Tag.objects.all())
+                                             queryset=Tag.objects.all(),
+                                             method='tags_filter')
     is_favorited = filters.BooleanFilter(
         method='is_favorited_filter')
     is_in_shopping_cart = filters.BooleanFilter(
         method='is_in_shopping_cart_filter')
+    search = filters.CharFilter(method='search_filter')
+    ordering = filters.ChoiceFilter(choices=(('popular', 'Популярные'),),
+                                    method='ordering_filter')
 
     class Meta:
         model = Recipe
         fields = ('tags', 'author',)
 
+    def tags_filter(self, queryset, name, value):
+        if not value:
+            return queryset
+        return queryset.with_tags(value)
+
     def is_favorited_filter(self, queryset, name, value):
         user = self.request.user
         if value and user.is_authenticated:
-            return queryset.filter(favorite_recipe__user=user)
+            return queryset.favorited_by(user)
         return queryset
 
     def is_in_shopping_cart_filter(self, queryset, name, value):
         user = self.request.user
         if value and user.is_authenticated:
-            return queryset.filter(shopping_list__user=user)
+            return queryset.in_shopping_cart_of(user)
         return queryset
+
+    def search_filter(self, queryset, name, value):
+        if connections[queryset.db].vendor == 'postgresql':
+            query = SearchQuery(value, config=SEARCH_CONFIG,
+                                search_type='websearch')
+            return (queryset.filter(search_vector=query)
+                    .annotate(rank=SearchRank(F('search_vector'), query))
+                    .order_by('-rank', '-pub_date', '-id'))
+        return (queryset
+                .filter(Q(name__icontains=value) | Q(text__icontains=value))
+                .annotate(rank=Case(When(name__icontains=value, then=2),
+                                    default=Value(1),
+                                    output_field=IntegerField()))
+                .order_by('-rank', '-pub_date', '-id'))
+
+    def ordering_filter(self, queryset, name, value):
+        return queryset.popular()
@@ -0,0 +1,206 @@
+import base64
+import json
+import os
+import time
+from io import BytesIO
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.authtoken.models import Token
+
+from api.management.commands.bench_http import percentiles
+from foodgram import settings
+from recipes.models import Ingredient, Recipe, Tag, User
+
+
+def get_user(pk=None):
+    """Пользователь pk или первый с непустыми корзиной и подписками."""
+    users = User.objects.filter(is_active=True)
+    if pk is not None:
+        users = users.filter(pk=pk)
+    else:
+        users = users.filter(shopping_list__isnull=False,
+                             subscriber__isnull=False).distinct()
+    user = users.order_by('pk').first()
+    if user is None:
+        raise CommandError(
+            'Нет подходящего пользователя, выполните generate_data')
+    return user
+
+
+def token_client(user):
+    """Тестовый клиент с токеном user."""
+    token, _ = Token.objects.get_or_create(user=user)
+    return Client(HTTP_HOST='localhost',
+                  HTTP_AUTHORIZATION=f'Token {token.key}')
+
+
+def image_data():
+    buffer = BytesIO()
+    Image.new('RGB', (600, 400), '#49B64E').save(buffer, 'JPEG')
+    return ('data:image/jpeg;base64,'
+            + base64.b64encode(buffer.getvalue()).decode())
+
+
+class Command(BaseCommand):
+    help = ("Задержки p50/p95/p99 и число запросов к БД для всех путей "
+            "API через тестовый клиент Django. Сравнивается с сохранёнными "
+            "результатами, регрессия завершает команду с ошибкой")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50,
+                            help='Запросов на каждый путь')
+        parser.add_argument('--user', type=int,
+                            help='id пользователя, от имени которого '
+                                 'идут запросы')
+        parser.add_argument(
+            '--baseline',
+            default=os.path.join(settings.BASE_DIR, 'benchmarks.json'),
+            help='Файл с сохранёнными результатами')
+        parser.add_argument('--save', action='store_true',
+                            help='Записать результаты как новые базовые')
+        parser.add_argument('--tolerance', type=float, default=0.5,
+                            help='Допустимый рост p95, доля от базового')
+
+    def handle(self, *args, **options):
+        user = get_user(options['user'])
+        self.client = token_client(user)
+        self.image = image_data()
+        self.results = {}
+        targets = self.get_targets(user)
+        for _ in range(options['requests']):
+            self.run_routes(**targets)
+        baseline = {}
+        if os.path.exists(options['baseline']):
+            with open(options['baseline'], encoding='utf-8') as file:
+                baseline = json.load(file)
+        failures = self.report(baseline, options['tolerance'])
+        if options['save']:
+            with open(options['baseline'], 'w', encoding='utf-8') as file:
+                json.dump(self.summary(), file, indent=2, sort_keys=True)
+            self.stdout.write(f"Результаты записаны в {options['baseline']}")
+        elif failures:
+            raise CommandError('Регрессия: ' + ', '.join(failures))
+
+    def request(self, name, method, path, data=None, status=200):
+        started = time.perf_counter()
+        with CaptureQueriesContext(connection) as queries:
+            if data is None:
+                response = getattr(self.client, method)(path)
+            else:
+                response = getattr(self.client, method)(
+                    path, data, content_type='application/json')
+            if response.streaming:
+                b''.join(response.streaming_content)
+        duration = time.perf_counter() - started
+        if response.status_code != status:
+            raise CommandError(f'{method.upper()} {path}: '
+                               f'{response.status_code} вместо {status}')
+        samples, counts = self.results.setdefault(name, ([], []))
+        samples.append(duration)
+        counts.append(len(queries))
+        return response
+
+    @staticmethod
+    def get_targets(user):
+        """Рецепты, автор, тег и ингредиент для запросов от user."""
+        recipe = Recipe.objects.order_by('-favorites_count').first()
+        other = (Recipe.objects
+                 .exclude(favorite_recipe__user=user)
+                 .exclude(shopping_list__user=user)
+                 .order_by('-pub_date').first())
+        author = (User.objects.exclude(pk=user.pk)
+                  .exclude(subscribing__user=user)
+                  .order_by('-subscribers_count').first())
+        tag = Tag.objects.first()
+        ingredient = Ingredient.objects.order_by('name').first()
+        targets = {'recipe': recipe, 'other': other, 'author': author,
+                   'tag': tag, 'ingredient': ingredient}
+        if None in targets.values():
+            raise CommandError('Мало данных, выполните generate_data')
+        return targets
+
+    def run_routes(self, recipe, other, author, tag, ingredient):
+        get = (
+            ('tags', '/api/tags/'),
+            ('tag', f'/api/tags/{tag.pk}/'),
+            ('ingredients', f'/api/ingredients/?name={ingredient.name[:2]}'),
+            ('ingredient', f'/api/ingredients/{ingredient.pk}/'),
+            ('recipes', '/api/recipes/'),
+            ('recipes limit=24', '/api/recipes/?limit=24'),
+            ('recipes popular', '/api/recipes/?ordering=popular'),
+            ('recipes tags', f'/api/recipes/?tags={tag.slug}'),
+            ('recipes favorited', '/api/recipes/?is_favorited=1'),
+            ('recipes in cart', '/api/recipes/?is_in_shopping_cart=1'),
+            ('recipes author', f'/api/recipes/?author={author.pk}'),
+            ('recipe', f'/api/recipes/{recipe.pk}/'),
+            ('download cart', '/api/recipes/download_shopping_cart/'),
+            ('feed', '/api/recipes/feed/'),
+            ('users', '/api/users/'),
+            ('user', f'/api/users/{author.pk}/'),
+            ('me', '/api/users/me/'),
+            ('subscriptions', '/api/users/subscriptions/'),
+            ('subscriptions recipes_limit=3',
+             '/api/users/subscriptions/?recipes_limit=3'),
+        )
+        for name, path in get:
+            self.request(name, 'get', path)
+        # Изменения парами, чтобы данные после прогона не менялись.
+        for name in ('favorite', 'shopping_cart'):
+            path = f'/api/recipes/{other.pk}/{name}/'
+            self.request(f'{name} add', 'post', path, status=201)
+            self.request(f'{name} remove', 'delete', path, status=204)
+            path = f'/api/recipes/{name}/'
+            self.request(f'{name} batch add', 'post', path,
+                         {'recipes': [other.pk]}, status=201)
+            self.request(f'{name} batch remove', 'delete', path,
+                         {'recipes': [other.pk]}, status=204)
+        path = f'/api/users/{author.pk}/subscribe/'
+        self.request('subscribe', 'post', path, status=201)
+        self.request('unsubscribe', 'delete', path, status=204)
+        data = {
+            'name': 'Тестовый рецепт',
+            'text': 'Описание.',
+            'cooking_time': 10,
+            'tags': [tag.pk],
+            'ingredients': [{'id': ingredient.pk, 'amount': 10}],
+            'image': self.image,
+        }
+        created = self.request('recipe create', 'post', '/api/recipes/',
+                               data, status=201).json()
+        path = f'/api/recipes/{created["id"]}/'
+        self.request('recipe update', 'patch', path, data)
+        self.request('recipe delete', 'delete', path, status=204)
+
+    def summary(self):
+        summary = {}
+        for name, (samples, counts) in self.results.items():
+            p50, p95, p99 = percentiles(samples)
+            summary[name] = {'p50': round(p50, 2), 'p95': round(p95, 2),
+                             'p99': round(p99, 2), 'queries': max(counts)}
+        return summary
+
+    def report(self, baseline, tolerance):
+        """Печатает результаты и возвращает пути с регрессией.
+
+        Регрессия - больше запросов к БД, чем в baseline, или p95
+        больше базового с учётом tolerance.
+        """
+        failures = []
+        self.stdout.write(f'{"path":32} {"p50":>8} {"p95":>8} {"p99":>8} '
+                          f'{"queries":>7} {"base p95":>8} {"base q":>6}')
+        for name, result in self.summary().items():
+            base = baseline.get(name)
+            line = (f'{name:32} {result["p50"]:8.1f} {result["p95"]:8.1f} '
+                    f'{result["p99"]:8.1f} {result["queries"]:7}')
+            if base is not None:
+                line += f' {base["p95"]:8.1f} {base["queries"]:6}'
+                if (result['queries'] > base['queries']
+                        or result['p95'] > base['p95'] * (1 + tolerance)):
+                    failures.append(name)
+                    line = self.style.ERROR(line)
+            self.stdout.write(line)
+        return failures
@@ -0,0 +1,70 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from statistics import quantiles
+from urllib.error import HTTPError
+from urllib.parse import quote, unquote
+from urllib.request import Request, urlopen
+
+from django.core.management.base import BaseCommand
+
+PATHS = (
+    '/api/tags/',
+    '/api/ingredients/?name=с',
+    '/api/recipes/',
+    '/api/recipes/?limit=24',
+)
+
+
+def percentiles(samples):
+    """p50, p95 и p99 в миллисекундах."""
+    if len(samples) < 2:
+        return (sum(samples) * 1000,) * 3
+    cuts = quantiles(samples, n=100, method='inclusive')
+    return cuts[49] * 1000, cuts[94] * 1000, cuts[98] * 1000
+
+
+class Command(BaseCommand):
+    help = ("Нагрузочный прогон запущенного сервера: запросов в секунду "
+            "и задержки по каждому пути. Запускается по очереди против "
+            "WSGI (foodgram.wsgi) и ASGI (foodgram.asgi) развёртывания")
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*', default=PATHS)
+        parser.add_argument('--url', default='http://127.0.0.1:8000')
+        parser.add_argument('--requests', type=int, default=500,
+                            help='Запросов на каждый путь')
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument('--token', help='Токен для Authorization')
+
+    def handle(self, *args, **options):
+        headers = {'Accept': 'application/json'}
+        if options['token']:
+            headers['Authorization'] = f'Token {options["token"]}'
+        self.stdout.write(f'{"path":40} {"rps":>8} {"p50":>8} {"p95":>8} '
+                          f'{"p99":>8} {"errors":>6}')
+        for path in options['paths']:
+            self.run(options['url'] + quote(path, safe='/?=&'),
+                     headers, options)
+
+    def run(self, url, headers, options):
+        def fetch(_):
+            started = time.perf_counter()
+            try:
+                with urlopen(Request(url, headers=headers)) as response:
+                    response.read()
+                    ok = True
+            except HTTPError:
+                ok = False
+            return time.perf_counter() - started, ok
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(options['concurrency']) as pool:
+            results = list(pool.map(fetch, range(options['requests'])))
+        elapsed = time.perf_counter() - started
+        samples = [duration for duration, _ in results]
+        errors = sum(not ok for _, ok in results)
+        p50, p95, p99 = percentiles(samples)
+        path = unquote(url.split('/', 3)[-1])
+        self.stdout.write(
+            f'/{path:39} {len(results) / elapsed:8.1f} {p50:8.1f} '
+            f'{p95:8.1f} {p99:8.1f} {errors:6}')
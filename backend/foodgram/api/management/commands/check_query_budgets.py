@@ -0,0 +1,90 @@
+from urllib.parse import urlsplit
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import resolve
+
+from api.management.commands.bench_api import get_user, token_client
+from foodgram.metrics import query_budget
+from recipes.models import Ingredient, Recipe, Tag
+
+PATHS = (
+    '/api/tags/',
+    '/api/tags/{tag}/',
+    '/api/ingredients/?name={ingredient_name}',
+    '/api/ingredients/{ingredient}/',
+    '/api/recipes/?limit={size}',
+    '/api/recipes/?limit={size}&cursor=',
+    '/api/recipes/?limit={size}&ordering=popular',
+    '/api/recipes/?limit={size}&is_favorited=1',
+    '/api/recipes/?limit={size}&is_in_shopping_cart=1',
+    '/api/recipes/?limit={size}&tags={tag_slug}&is_favorited=1',
+    '/api/recipes/{recipe}/',
+    '/api/recipes/feed/?limit={size}',
+    '/api/users/subscriptions/?limit={size}',
+    '/api/users/subscriptions/?limit={size}&recipes_limit=3',
+)
+# Отдельный кэш, который очищается перед каждым запросом:
+# считаются запросы при промахе кэша ответов и рецептов.
+EMPTY_CACHE = {'default': {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    'LOCATION': 'query-budgets',
+}}
+
+
+class Command(BaseCommand):
+    help = ("Проверка query_budgets view: число запросов к БД не больше "
+            "бюджета и не растёт с размером страницы")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int,
+                            help='id пользователя, от имени которого '
+                                 'идут запросы')
+        parser.add_argument('--sizes', type=int, nargs='+',
+                            default=(1, 10, 50),
+                            help='Размеры страницы (?limit=)')
+
+    def handle(self, *args, **options):
+        client = token_client(get_user(options['user']))
+        tag = Tag.objects.first()
+        ingredient = Ingredient.objects.order_by('name').first()
+        targets = {
+            'tag': tag and tag.pk,
+            'tag_slug': tag and tag.slug,
+            'ingredient': ingredient and ingredient.pk,
+            'ingredient_name': ingredient and ingredient.name[:2],
+            'recipe': Recipe.objects.values_list('pk', flat=True).first(),
+        }
+        if None in targets.values():
+            raise CommandError('Мало данных, выполните generate_data')
+        sizes = sorted(options['sizes'])
+        failures = []
+        with override_settings(CACHES=EMPTY_CACHE):
+            # Первый запрос заполняет кэш токенов в памяти процесса.
+            client.get('/api/users/me/')
+            for template in PATHS:
+                counts = []
+                for size in sizes:
+                    path = template.format(size=size, **targets)
+                    cache.clear()
+                    with CaptureQueriesContext(connection) as queries:
+                        response = client.get(path)
+                    if response.status_code != 200:
+                        raise CommandError(
+                            f'{path}: {response.status_code}')
+                    counts.append(len(queries))
+                budget = query_budget(
+                    resolve(urlsplit(path).path).func, 'GET')
+                line = (f'{template:60} '
+                        f'{" ".join(f"{count:3}" for count in counts)} '
+                        f'{"-" if budget is None else budget:>6}')
+                if ((budget is not None and max(counts) > budget)
+                        or counts[-1] > counts[0]):
+                    failures.append(template)
+                    line = self.style.ERROR(line)
+                self.stdout.write(line)
+        if failures:
+            raise CommandError('Превышен бюджет запросов: '
+                               + ', '.join(failures))
@@ -0,0 +1,61 @@
+from django.core.cache import cache
+from django.utils.cache import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from foodgram.settings import CATALOG_CACHE_TIMEOUT, INGREDIENT_SEARCH_LIMIT
+from recipes.index import ingredient_index
+from recipes.versions import get_catalog_version
+
+
+class IngredientIndexListMixin:
+    """Список ингредиентов и поиск по началу названия из индекса."""
+
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get(api_settings.SEARCH_PARAM)
+        if name:
+            return Response(ingredient_index.search(
+                name, limit=INGREDIENT_SEARCH_LIMIT))
+        return Response(ingredient_index.all())
+
+
+def catalog_headers(version, renderer):
+    return {'ETag': f'"catalog-{version}-{renderer}"',
+            'Cache-Control': 'no-cache'}
+
+
+def catalog_not_modified(request, headers):
+    if_none_match = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+    return headers['ETag'] in if_none_match or '*' in if_none_match
+
+
+def catalog_key(version, request):
+    return f'catalog:{version}:{request.get_full_path()}'
+
+
+class CatalogCacheMixin:
+    """Кэш ответов справочников по версии каталога с ETag и 304."""
+
+    def catalog_response(self, handler, request, *args, **kwargs):
+        version = get_catalog_version()
+        headers = catalog_headers(version, request.accepted_renderer.format)
+        if catalog_not_modified(request, headers):
+            return Response(status=status.HTTP_304_NOT_MODIFIED,
+                            headers=headers)
+        key = catalog_key(version, request)
+        data = cache.get(key)
+        if data is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            data = response.data
+            cache.set(key, data, CATALOG_CACHE_TIMEOUT)
+        return Response(data, headers=headers)
+
+    def list(self, request, *args, **kwargs):
+        return self.catalog_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.catalog_response(super().retrieve,
+                                     request, *args, **kwargs)
@@ -1,6 +1,161 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as Base64Error
+from datetime import datetime
+
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+from foodgram.settings import ESTIMATED_COUNT_THRESHOLD
+from users.models import Timeline
+
+
+def estimated_count(queryset):
+    """Число строк по оценке планировщика PostgreSQL.
+
+    Для небольших выборок и других СУБД возвращает точный COUNT(*).
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    rows = plan[0]['Plan']['Plan Rows']
+    if rows < ESTIMATED_COUNT_THRESHOLD:
+        return queryset.count()
+    return rows
+
+
+class EstimatedCountPaginator(Paginator):
+    @cached_property
+    def count(self):
+        return estimated_count(self.object_list)
+
+
+class KeysetPaginator(CursorPagination):
+    """Курсорная пагинация по Meta.ordering модели с добором по id.
+
+    Позиция курсора - значение первого поля сортировки, поэтому
+    выборки с другой сортировкой (поиск, популярные) отклоняются.
+    """
+    page_size_query_param = 'limit'
+    max_page_size = 100
+
+    def __init__(self, estimate=False):
+        self.estimate = estimate
+        self.count = None
+
+    def get_ordering(self, request, queryset, view):
+        ordering = tuple(queryset.model._meta.ordering)
+        if not {'id', '-id', 'pk', '-pk'} & set(ordering):
+            ordering += ('-id',)
+        active = tuple(queryset.query.order_by)
+        if active and active != ordering:
+            raise ValidationError({self.cursor_query_param: [
+                'Курсорная пагинация не сочетается с search и ordering.']})
+        return ordering
+
+    def decode_cursor(self, request):
+        if not request.query_params.get(self.cursor_query_param):
+            return None
+        return super().decode_cursor(request)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.estimate:
+            self.count = estimated_count(queryset)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'count': self.count,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
 
 
 class CustomPaginator(PageNumberPagination):
+    """Постраничная пагинация.
+
+    ?cursor= включает курсорный режим без OFFSET и COUNT(*),
+    ?count=estimated - оценку числа объектов вместо точного подсчёта.
+    """
     page_size_query_param = 'limit'
     max_page_size = 100
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    keyset = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        estimate = (request.query_params.get(self.count_query_param)
+                    == 'estimated')
+        if self.cursor_query_param in request.query_params:
+            self.keyset = KeysetPaginator(estimate=estimate)
+            return self.keyset.paginate_queryset(queryset, request, view)
+        if estimate:
+            self.django_paginator_class = EstimatedCountPaginator
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
+class TimelinePaginator:
+    """Курсорная пагинация ленты подписок по (pub_date, id рецепта)."""
+    page_size_query_param = 'limit'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+
+    def __init__(self):
+        self.next = None
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return api_settings.PAGE_SIZE
+        return min(max(size, 1), self.max_page_size)
+
+    @staticmethod
+    def encode_cursor(entry):
+        pub_date, recipe = entry
+        return urlsafe_b64encode(
+            f'{pub_date.isoformat()}|{recipe}'.encode()).decode()
+
+    def decode_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+        try:
+            pub_date, recipe = (urlsafe_b64decode(cursor.encode())
+                                .decode().split('|'))
+            return datetime.fromisoformat(pub_date), int(recipe)
+        except (Base64Error, UnicodeDecodeError, ValueError):
+            raise NotFound('Неверный курсор.')
+
+    def paginate(self, request):
+        """Пары (pub_date, id рецепта) текущей страницы."""
+        size = self.get_page_size(request)
+        entries = Timeline.objects.page(request.user, size + 1,
+                                        self.decode_cursor(request))
+        if len(entries) > size:
+            entries = entries[:size]
+            self.next = replace_query_param(
+                request.build_absolute_uri(), self.cursor_query_param,
+                self.encode_cursor(entries[-1]))
+        return entries
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.next, 'results': data})
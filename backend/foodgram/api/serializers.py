@@ -1,47 +1,88 @@
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db import models, transaction
+from django.db.models import prefetch_related_objects
 from drf_base64.fields import Base64ImageField
 from rest_framework import serializers
 
-from recipes.models import (Favorites, Ingredient, IngredientCount, Recipe,
-                            ShoppingCart, Tag, User)
+from foodgram.settings import RECIPE_BATCH_LIMIT, RECIPE_CACHE_TIMEOUT
+from recipes.models import (Ingredient, IngredientCount, Recipe,
+                            ShoppingListItem, Tag, User,
+                            recipe_prefetch_lookups)
+from recipes.versions import (CATALOG_VERSION_KEY, aget_versions, get_versions,
+                              recipe_version_key, user_version_key)
 from users.serializers import UserViewSerializer
+from users.viewer import viewer_ids
+
+
+class ImageVariantsField(serializers.ReadOnlyField):
+    """Ссылки на уменьшенные копии картинки рецепта."""
+
+    def to_representation(self, value):
+        request = self.context.get('request')
+        if value is None or request is None:
+            return value
+        return {
+            variant: {extension: request.build_absolute_uri(url)
+                      for extension, url in urls.items()}
+            for variant, urls in value.items()
+        }
 
 
 class RecipeShortSerializer(serializers.ModelSerializer):
     """Для использования в подписках."""
     name = serializers.ReadOnlyField()
     cooking_time = serializers.ReadOnlyField()
+    images = ImageVariantsField()
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'images', 'cooking_time')
         read_only_fields = ('image',)
 
 
+class RecipeBatchSerializer(serializers.Serializer):
+    """Список id рецептов для пакетного добавления и удаления."""
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=RECIPE_BATCH_LIMIT,
+    )
+
+    def validate_recipes(self, value):
+        recipe_ids = list(dict.fromkeys(value))
+        found = Recipe.objects.in_bulk(recipe_ids)
+        missing = [pk for pk in recipe_ids if pk not in found]
+        if missing:
+            raise serializers.ValidationError(
+                f'Рецепты не найдены: {", ".join(map(str, missing))}.'
+            )
+        return [found[pk] for pk in recipe_ids]
+
+
 class SubscribeSerializer(serializers.ModelSerializer):
     """Подписка на автора и отписка."""
     is_subscribed = serializers.SerializerMethodField()
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
+    recipes_count = serializers.ReadOnlyField()
     email = serializers.ReadOnlyField()
     username = serializers.ReadOnlyField()
 
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        limit = request.GET.get('recipes_limit')
-        recipes = Recipe.objects.filter(author=obj)
-        if limit:
-            recipes = recipes[:int(limit)]
+        if hasattr(obj, 'limited_recipes'):
+            recipes = obj.limited_recipes
+        else:
+            request = self.context.get('request')
+            limit = request.GET.get('recipes_limit')
+            recipes = Recipe.objects.filter(author=obj)
+            if limit:
+                recipes = recipes[:int(limit)]
         return RecipeShortSerializer(recipes, many=True, read_only=True).data
 
     def get_is_subscribed(self, obj):
-        if (self.context.get('request')
-                and not self.context['request'].user.is_anonymous):
-            user = self.context['request'].user
-            return user.subscriber.filter(author=obj).exists()
-        return False
-
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+        return obj.pk in viewer_ids(self.context, 'subscriptions')
 
     class Meta:
         model = User
@@ -54,7 +95,7 @@ class TagSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Tag
-        fields = '__all__'
+        fields = ('id', 'name', 'color', 'slug')
 
 
 class IngredientSerializer(serializers.ModelSerializer):
@@ -78,6 +119,14 @@ class RecipeIngredientsSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit', 'amount',)
 
 
+class RecipeListSerializer(serializers.ListSerializer):
+    """Список рецептов: кэш запрашивается одним обращением на страницу."""
+
+    def to_representation(self, data):
+        recipes = data.all() if isinstance(data, models.Manager) else data
+        return self.child.represent(list(recipes))
+
+
 class RecipeGetSerializer(serializers.ModelSerializer):
     """[GET] Рецепт(ы)."""
     tags = TagSerializer(many=True, read_only=True)
@@ -87,28 +136,113 @@ class RecipeGetSerializer(serializers.ModelSerializer):
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
     image = Base64ImageField()
+    images = ImageVariantsField()
 
     def get_is_favorited(self, obj):
-        return (
-                self.context.get('request').user.is_authenticated
-                and Favorites.objects.filter(
-            user=self.context['request'].user, recipe=obj
-        ).exists()
-        )
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
+        return obj.pk in viewer_ids(self.context, 'favorites')
 
     def get_is_in_shopping_cart(self, obj):
-        return (
-                self.context.get('request').user.is_authenticated
-                and ShoppingCart.objects.filter(
-            user=self.context['request'].user, recipe=obj
-        ).exists()
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
+        return obj.pk in viewer_ids(self.context, 'shopping_cart')
+
+    def set_user_flags(self, instance):
+        instance.is_favorited = self.get_is_favorited(instance)
+        instance.is_in_shopping_cart = self.get_is_in_shopping_cart(instance)
+        if hasattr(instance, 'author_is_subscribed'):
+            instance.author.is_subscribed = instance.author_is_subscribed
+        else:
+            instance.author.is_subscribed = (
+                self.fields['author'].get_is_subscribed(instance.author))
+
+    @staticmethod
+    def version_keys(recipes):
+        return list(
+            {CATALOG_VERSION_KEY}
+            | {recipe_version_key(recipe.pk) for recipe in recipes}
+            | {user_version_key(recipe.author_id) for recipe in recipes}
         )
 
+    def fragment_keys(self, recipes, versions):
+        """Ключи кэша рецептов по версиям рецепта, автора и каталога."""
+        request = self.context.get('request')
+        host = request.build_absolute_uri('/') if request else ''
+        return {
+            recipe.pk: 'recipe:{}:{}:{}:{}:{}'.format(
+                host, recipe.pk,
+                versions[recipe_version_key(recipe.pk)],
+                versions[user_version_key(recipe.author_id)],
+                versions[CATALOG_VERSION_KEY])
+            for recipe in recipes
+        }
+
+    def build_fragments(self, recipes, keys):
+        """Общая часть рецептов, которых нет в кэше, с записью в кэш."""
+        prefetch_related_objects(recipes, *recipe_prefetch_lookups())
+        built = {}
+        for recipe in recipes:
+            fragment = super().to_representation(recipe)
+            fragment['is_favorited'] = None
+            fragment['is_in_shopping_cart'] = None
+            fragment['author']['is_subscribed'] = None
+            built[keys[recipe.pk]] = fragment
+        cache.set_many(built, RECIPE_CACHE_TIMEOUT)
+        return built
+
+    def represent(self, recipes):
+        """Общая часть из кэша, флаги пользователя поверх неё."""
+        for recipe in recipes:
+            self.set_user_flags(recipe)
+        keys = self.fragment_keys(
+            recipes, get_versions(self.version_keys(recipes)))
+        fragments = cache.get_many(keys.values())
+        missed = [recipe for recipe in recipes
+                  if keys[recipe.pk] not in fragments]
+        if missed:
+            fragments.update(self.build_fragments(missed, keys))
+        return self.merge(recipes, keys, fragments)
+
+    async def arepresent(self, recipes):
+        """represent для async view.
+
+        Флаги пользователя должны быть в аннотациях (with_user_flags),
+        рецепты, которых нет в кэше, строятся в синхронном потоке.
+        """
+        for recipe in recipes:
+            self.set_user_flags(recipe)
+        keys = self.fragment_keys(
+            recipes, await aget_versions(self.version_keys(recipes)))
+        fragments = await cache.aget_many(keys.values())
+        missed = [recipe for recipe in recipes
+                  if keys[recipe.pk] not in fragments]
+        if missed:
+            fragments.update(
+                await sync_to_async(self.build_fragments)(missed, keys))
+        return self.merge(recipes, keys, fragments)
+
+    @staticmethod
+    def merge(recipes, keys, fragments):
+        result = []
+        for recipe in recipes:
+            data = fragments[keys[recipe.pk]].copy()
+            data['author'] = data['author'].copy()
+            data['is_favorited'] = recipe.is_favorited
+            data['is_in_shopping_cart'] = recipe.is_in_shopping_cart
+            data['author']['is_subscribed'] = recipe.author.is_subscribed
+            result.append(data)
+        return result
+
+    def to_representation(self, instance):
+        return self.represent([instance])[0]
+
     class Meta:
         model = Recipe
         fields = ('id', 'tags', 'author', 'ingredients',
                   'is_favorited', 'is_in_shopping_cart',
-                  'name', 'image', 'text', 'cooking_time')
+                  'name', 'image', 'images', 'text', 'cooking_time')
+        list_serializer_class = RecipeListSerializer
 
 
 class RecipeIngredientCreateSerializer(serializers.ModelSerializer):
@@ -149,6 +283,12 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError(
                 'Ингредиенты должны быть уникальны.'
             )
+        found = Ingredient.objects.in_bulk(unique_ingredient_id_list)
+        missing = sorted(unique_ingredient_id_list - found.keys())
+        if missing:
+            raise serializers.ValidationError(
+                f'Ингредиенты не найдены: {", ".join(map(str, missing))}.'
+            )
         return obj
 
     def tags_and_ingredients_set(self, recipe, tags, ingredients):
@@ -156,11 +296,36 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         IngredientCount.objects.bulk_create(
             [IngredientCount(
                 recipe=recipe,
-                ingredient=Ingredient.objects.get(pk=ingredient['id']),
+                ingredient_id=ingredient['id'],
                 amount=ingredient['amount']
             ) for ingredient in ingredients]
         )
 
+    def ingredients_update(self, recipe, ingredients):
+        """Изменение ингредиентов рецепта по разнице со старыми.
+
+        Возвращает id ингредиентов, которые были изменены.
+        """
+        current = {row.ingredient_id: row for row in recipe.recipes.all()}
+        new = {item['id']: item['amount'] for item in ingredients}
+        removed = current.keys() - new.keys()
+        created = [IngredientCount(recipe=recipe, ingredient_id=pk,
+                                   amount=amount)
+                   for pk, amount in new.items() if pk not in current]
+        updated = []
+        for pk, row in current.items():
+            if pk in new and row.amount != new[pk]:
+                row.amount = new[pk]
+                updated.append(row)
+        if removed:
+            IngredientCount.objects.filter(
+                recipe=recipe, ingredient__in=removed).delete()
+        IngredientCount.objects.bulk_create(created)
+        IngredientCount.objects.bulk_update(updated, ['amount'])
+        return ([*removed] + [row.ingredient_id for row in created]
+                + [row.ingredient_id for row in updated])
+
+    @transaction.atomic
     def create(self, validated_data):
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
@@ -169,19 +334,19 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         self.tags_and_ingredients_set(recipe, tags, ingredients)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         instance.image = validated_data.get('image', instance.image)
         instance.name = validated_data.get('name', instance.name)
         instance.text = validated_data.get('text', instance.text)
         instance.cooking_time = validated_data.get(
             'cooking_time', instance.cooking_time)
-        tags = validated_data.pop('tags')
-        ingredients = validated_data.pop('ingredients')
-        IngredientCount.objects.filter(
-            recipe=instance,
-            ingredient__in=instance.ingredients.all()).delete()
-        self.tags_and_ingredients_set(instance, tags, ingredients)
+        instance.tags.set(validated_data.pop('tags'))
+        changed = self.ingredients_update(instance,
+                                          validated_data.pop('ingredients'))
         instance.save()
+        if changed:
+            ShoppingListItem.objects.refresh_recipe(instance, changed)
         return instance
 
     def to_representation(self, instance):
@@ -0,0 +1,22 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from api.authentication import token_cache
+from recipes.models import User
+
+
+@receiver(post_delete, sender=Token)
+def forget_deleted_token(sender, instance, **kwargs):
+    token_cache.delete(instance.key)
+
+
+@receiver(post_save, sender=User)
+def forget_user_tokens(sender, instance, created, update_fields=None,
+                       **kwargs):
+    # Смена пароля, деактивация и правка профиля сбрасывают кэш,
+    # обновление last_login при входе - нет.
+    if created or (update_fields and set(update_fields) == {'last_login'}):
+        return
+    token_cache.delete(
+        *Token.objects.filter(user=instance).values_list('key', flat=True))
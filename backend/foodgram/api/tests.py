@@ -0,0 +1,109 @@
+import json
+
+from asgiref.sync import async_to_sync
+from django.test import RequestFactory, TestCase
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.async_views import (recipe_detail_response, recipe_list_response,
+                             subscriptions_response)
+from api.authentication import token_cache
+from recipes.models import Favorites, Recipe, Tag, User
+from users.models import Subscribe
+
+
+class CachedTokenAuthenticationTest(TestCase):
+    """Пользователь из кэша токенов не записывается обратно в БД."""
+
+    def setUp(self):
+        token_cache.items.clear()
+        self.author = User.objects.create_user(
+            username='author', email='author@example.com',
+            password='old-password-123', first_name='Имя')
+        self.reader = User.objects.create_user(
+            username='reader', email='reader@example.com')
+        self.client = self.token_client(self.author)
+
+    @staticmethod
+    def token_client(user):
+        client = APIClient(HTTP_HOST='localhost')
+        client.credentials(
+            HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=user)}')
+        return client
+
+    def test_set_password_keeps_newer_data(self):
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 200)
+        response = self.token_client(self.reader).post(
+            f'/api/users/{self.author.pk}/subscribe/')
+        self.assertEqual(response.status_code, 201)
+        User.objects.filter(pk=self.author.pk).update(first_name='Новое')
+        response = self.client.post('/api/users/set_password/', {
+            'current_password': 'old-password-123',
+            'new_password': 'new-password-456',
+        })
+        self.assertEqual(response.status_code, 204)
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.subscribers_count, 1)
+        self.assertEqual(self.author.first_name, 'Новое')
+        self.assertTrue(self.author.check_password('new-password-456'))
+
+
+class AsyncViewsTest(TestCase):
+    """Async view отвечают так же, как синхронные viewset."""
+
+    def setUp(self):
+        token_cache.items.clear()
+        self.author = User.objects.create_user(
+            username='author', email='author@example.com')
+        self.reader = User.objects.create_user(
+            username='reader', email='reader@example.com')
+        self.client = CachedTokenAuthenticationTest.token_client(self.reader)
+        self.token = Token.objects.get(user=self.reader)
+        self.tags = [Tag.objects.create(name=name, color='#49B64E', slug=slug)
+                     for name, slug in (('Завтрак', 'breakfast'),
+                                        ('Обед', 'lunch'))]
+        for number in range(8):
+            recipe = Recipe.objects.create(
+                author=self.author, name=f'Рецепт {number}',
+                text='Описание.', cooking_time=10,
+                image='recipes/images/test.jpg')
+            recipe.tags.set(self.tags[:number % 2 + 1])
+            if number % 3 == 0:
+                Favorites.objects.add(self.reader, recipe.pk)
+        Subscribe.objects.add(self.reader, self.author.pk)
+        # Токен попадает в кэш процесса.
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 200)
+
+    def async_response(self, handler, url, **kwargs):
+        request = RequestFactory(HTTP_HOST='localhost').get(
+            url, HTTP_AUTHORIZATION=f'Token {self.token}')
+        return async_to_sync(handler)(request, **kwargs)
+
+    def assert_same(self, handler, url, **kwargs):
+        response = self.async_response(handler, url, **kwargs)
+        self.assertIsNotNone(response, url)
+        self.assertEqual(json.loads(response.content),
+                         self.client.get(url).json(), url)
+
+    def test_recipe_list(self):
+        for query in ('', '?page=2', '?limit=3&page=3', '?tags=lunch',
+                      '?tags=breakfast&tags=lunch', '?is_favorited=1',
+                      '?is_favorited=false', '?is_in_shopping_cart=true',
+                      f'?author={self.author.pk}&ordering=popular'):
+            self.assert_same(recipe_list_response, f'/api/recipes/{query}')
+
+    def test_recipe_list_fallback(self):
+        for query in ('?search=Рецепт', '?tags=dinner', '?author=0',
+                      '?page=5', '?page=last', '?ordering=name'):
+            self.assertIsNone(self.async_response(
+                recipe_list_response, f'/api/recipes/{query}'), query)
+
+    def test_recipe_detail(self):
+        recipe = Recipe.objects.first()
+        self.assert_same(recipe_detail_response,
+                         f'/api/recipes/{recipe.pk}/', pk=recipe.pk)
+
+    def test_subscriptions(self):
+        for query in ('', '?recipes_limit=2', '?limit=1'):
+            self.assert_same(subscriptions_response,
+                             f'/api/users/subscriptions/{query}')
@@ -0,0 +1,51 @@
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.http.multipartparser import MultiPartParserError
+from PIL import ImageFile
+
+from foodgram.settings import IMAGE_UPLOAD_MAX_SIDE, IMAGE_UPLOAD_MAX_SIZE
+
+# Сколько байт начала файла читать в поисках размеров картинки.
+IMAGE_HEADER_MAX_SIZE = 64 * 1024
+
+
+class ImageUploadError(MultiPartParserError):
+    pass
+
+
+class LimitedImageUploadHandler(TemporaryFileUploadHandler):
+    """Пишет загрузку во временный файл, проверяя ограничения по ходу.
+
+    Размер файла проверяется на каждом чанке, размеры картинки -
+    как только из начала файла удаётся прочитать заголовок.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+        self.header = ImageFile.Parser()
+        self.header_checked = False
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > IMAGE_UPLOAD_MAX_SIZE:
+            raise ImageUploadError(
+                'Картинка больше '
+                f'{IMAGE_UPLOAD_MAX_SIZE // (1024 * 1024)} МБ.')
+        if not self.header_checked:
+            self.check_header(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def check_header(self, raw_data):
+        try:
+            self.header.feed(raw_data)
+        except (OSError, SyntaxError):
+            self.header_checked = True
+            return
+        if self.header.image is not None:
+            self.header_checked = True
+            if max(self.header.image.size) > IMAGE_UPLOAD_MAX_SIDE:
+                raise ImageUploadError(
+                    'Сторона картинки больше '
+                    f'{IMAGE_UPLOAD_MAX_SIDE} пикселей.')
+        elif self.received > IMAGE_HEADER_MAX_SIZE:
+            self.header_checked = True
@@ -1,6 +1,11 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
+from foodgram.settings import ASYNC_VIEWS
+
+from .async_views import (async_view, cached_catalog_response,
+                          recipe_detail_response, recipe_list_response,
+                          subscriptions_response)
 from .views import (IngredientsViewSet, RecipeViewSet, SubscribeViewSet,
                     SubscriptionsViewSet, TagViewSet)
 
@@ -21,3 +26,25 @@ urlpatterns = [
     path(r'', include('djoser.urls')),
     path('', include(router.urls)),
 ]
+
+if ASYNC_VIEWS:
+    urlpatterns = [
+        path(r'tags/', async_view(
+            TagViewSet, {'get': 'list'}, cached_catalog_response)),
+        path(r'tags/<int:pk>/', async_view(
+            TagViewSet, {'get': 'retrieve'}, cached_catalog_response)),
+        path(r'ingredients/', async_view(
+            IngredientsViewSet, {'get': 'list'}, cached_catalog_response)),
+        path(r'ingredients/<int:pk>/', async_view(
+            IngredientsViewSet, {'get': 'retrieve'},
+            cached_catalog_response)),
+        path(r'recipes/', async_view(
+            RecipeViewSet, {'get': 'list', 'post': 'create'},
+            recipe_list_response)),
+        path(r'recipes/<int:pk>/', async_view(
+            RecipeViewSet, {'get': 'retrieve', 'patch': 'partial_update',
+                            'delete': 'destroy'},
+            recipe_detail_response)),
+        path(r'users/subscriptions/', async_view(
+            SubscriptionsViewSet, {'get': 'list'}, subscriptions_response)),
+    ] + urlpatterns
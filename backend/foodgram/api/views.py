@@ -1,21 +1,27 @@
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.db.models import BooleanField, Prefetch, Value
+from django.http import Http404, StreamingHttpResponse
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework import filters, mixins, status, viewsets
+from rest_framework import mixins, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.generics import get_object_or_404
+from rest_framework.parsers import JSONParser, MultiPartParser
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
+from api.exports import EXPORT_FORMATS, shopping_list
 from api.filters import RecipeFilter
-from api.pagination import CustomPaginator
+from api.mixins import CatalogCacheMixin, IngredientIndexListMixin
+from api.negotiation import IgnoreFormatNegotiation
+from api.pagination import CustomPaginator, TimelinePaginator
 from api.permissions import IsAuthorOrReadOnly
-from api.serializers import (IngredientSerializer, RecipeCreateSerializer,
-                             RecipeGetSerializer, RecipeShortSerializer,
-                             SubscribeSerializer, TagSerializer)
-from foodgram.settings import FILE
-from recipes.models import (Favorites, Ingredient, IngredientCount, Recipe,
-                            ShoppingCart, Tag, User)
+from api.serializers import (IngredientSerializer, RecipeBatchSerializer,
+                             RecipeCreateSerializer, RecipeGetSerializer,
+                             RecipeShortSerializer, SubscribeSerializer,
+                             TagSerializer)
+from api.uploads import LimitedImageUploadHandler
+from foodgram.settings import FILE, IDEMPOTENT_PARAM
+from recipes.models import (Favorites, Ingredient, Recipe, ShoppingCart, Tag,
+                            User)
 from users.models import Subscribe
 
 
@@ -25,58 +31,79 @@ class SubscriptionsViewSet(mixins.ListModelMixin,
     pagination_class = CustomPaginator
     permission_classes = (IsAuthenticated,)
     http_method_names = ('get',)
+    query_budgets = {'list': 4}
 
     def get_queryset(self):
-        return User.objects.filter(subscribing__user=self.request.user)
+        recipes = Recipe.objects.all()
+        limit = self.request.query_params.get('recipes_limit')
+        if limit and limit.isdigit():
+            recipes = recipes.latest_per_author(int(limit))
+        return (
+            User.objects
+            .filter(subscribing__user=self.request.user)
+            .annotate(is_subscribed=Value(True, output_field=BooleanField()))
+            .prefetch_related(Prefetch('recipes', queryset=recipes,
+                                       to_attr='limited_recipes'))
+        )
+
+
+def is_idempotent(request):
+    """?idempotent=1: повторное добавление или удаление - не ошибка."""
+    return request.query_params.get(IDEMPOTENT_PARAM) in ('1', 'true')
 
 
 class SubscribeViewSet(mixins.RetrieveModelMixin,
                        viewsets.GenericViewSet):
+    query_budgets = {'post_subscribe': 12, 'delete_subscribe': 9}
+
     @action(detail=True,
             methods=['post', ],
             permission_classes=(IsAuthenticated,),
             url_path='')
     def post_subscribe(self, request, **kwargs):
-        author = get_object_or_404(User, pk=kwargs['pk'])
-        serializer = SubscribeSerializer(
-            author, data=request.data, context={"request": request})
-        if request.user == author:
+        if request.user.pk == kwargs['pk']:
             return Response({'detail': 'Ошибка подписки'},
                             status=status.HTTP_400_BAD_REQUEST)
-        if Subscribe.objects.filter(user=request.user,
-                                    author=author).exists():
+        author = Subscribe.objects.add(request.user, kwargs['pk'])
+        if author is None:
+            raise Http404
+        if not author.created and not is_idempotent(request):
             return Response({'detail': 'Вы уже подписаны'},
                             status=status.HTTP_400_BAD_REQUEST)
-        serializer.is_valid(raise_exception=True)
-        Subscribe.objects.create(user=request.user, author=author)
+        serializer = SubscribeSerializer(author,
+                                         context={"request": request})
         return Response(serializer.data,
-                        status=status.HTTP_201_CREATED)
+                        status=(status.HTTP_201_CREATED if author.created
+                                else status.HTTP_200_OK))
 
     @post_subscribe.mapping.delete
     def delete_subscribe(self, request, **kwargs):
-        author = get_object_or_404(User, pk=kwargs['pk'])
-        get_object_or_404(Subscribe, user=request.user,
-                          author=author).delete()
+        if (not Subscribe.objects.remove(request.user, kwargs['pk'])
+                and not is_idempotent(request)):
+            get_object_or_404(User, pk=kwargs['pk'])
+            raise Http404
         return Response({'detail': 'Успешная отписка'},
                         status=status.HTTP_204_NO_CONTENT)
 
 
-class TagViewSet(mixins.ListModelMixin,
+class TagViewSet(CatalogCacheMixin,
+                 mixins.ListModelMixin,
                  mixins.RetrieveModelMixin,
                  viewsets.GenericViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
+    query_budgets = {'list': 2, 'retrieve': 2}
 
 
-class IngredientsViewSet(mixins.ListModelMixin,
+class IngredientsViewSet(CatalogCacheMixin,
+                         IngredientIndexListMixin,
                          mixins.RetrieveModelMixin,
                          viewsets.GenericViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     pagination_class = None
-    filter_backends = (filters.SearchFilter,)
-    search_fields = ('^name',)
+    query_budgets = {'list': 2, 'retrieve': 2}
 
 
 class RecipeViewSet(viewsets.ModelViewSet):
@@ -85,89 +112,168 @@ class RecipeViewSet(viewsets.ModelViewSet):
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
     http_method_names = ('get', 'post', 'patch', 'create', 'delete')
+    parser_classes = (JSONParser, MultiPartParser)
+    lookup_value_regex = r'\d+'
+    # Запросов к БД при пустом кэше, не зависит от размера страницы
+    # (python manage.py check_query_budgets).
+    query_budgets = {
+        'list': 6,
+        'retrieve': 4,
+        'create': 22,
+        'partial_update': 16,
+        'destroy': 11,
+        'favorite': 8,
+        'delete_item_from_favorite': 8,
+        'favorite_batch': 8,
+        'delete_favorite_batch': 9,
+        'shopping_cart': 12,
+        'delete_item_from_shopping_cart': 11,
+        'shopping_cart_batch': 11,
+        'delete_shopping_cart_batch': 12,
+        'download_shopping_cart': 2,
+        'feed': 6,
+    }
+
+    def initialize_request(self, request, *args, **kwargs):
+        request.upload_handlers = [LimitedImageUploadHandler(request)]
+        return super().initialize_request(request, *args, **kwargs)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action not in ('list', 'retrieve', 'feed'):
+            return queryset
+        # Теги и ингредиенты догружает сериализатор только для
+        # рецептов, которых нет в кэше.
+        return (queryset.select_related('author')
+                .with_user_flags(self.request.user))
 
     def get_serializer_class(self):
-        if self.action in ('list', 'retrieve'):
+        if self.action in ('list', 'retrieve', 'feed'):
             return RecipeGetSerializer
         return RecipeCreateSerializer
 
+    def add_recipe(self, queryset, error):
+        recipe = queryset.add(self.request.user, self.kwargs['pk'])
+        if recipe is None:
+            raise Http404
+        if not recipe.created and not is_idempotent(self.request):
+            return Response({'detail': error},
+                            status=status.HTTP_400_BAD_REQUEST)
+        serializer = RecipeShortSerializer(
+            recipe, context={"request": self.request})
+        return Response(serializer.data,
+                        status=(status.HTTP_201_CREATED if recipe.created
+                                else status.HTTP_200_OK))
+
+    def remove_recipe(self, queryset, error, detail):
+        if (not queryset.remove(self.request.user, self.kwargs['pk'])
+                and not is_idempotent(self.request)):
+            get_object_or_404(Recipe, pk=self.kwargs['pk'])
+            return Response({'detail': error},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response({'detail': detail},
+                        status=status.HTTP_204_NO_CONTENT)
+
+    def add_recipes(self, queryset):
+        serializer = RecipeBatchSerializer(data=self.request.data)
+        serializer.is_valid(raise_exception=True)
+        recipes = serializer.validated_data['recipes']
+        queryset.add_many(self.request.user, recipes)
+        serializer = RecipeShortSerializer(
+            recipes, many=True, context={"request": self.request})
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    def remove_recipes(self, queryset):
+        """Без списка recipes в теле запроса удаляет всё."""
+        recipe_ids = None
+        if self.request.data:
+            serializer = RecipeBatchSerializer(data=self.request.data)
+            serializer.is_valid(raise_exception=True)
+            recipe_ids = [recipe.pk for recipe
+                          in serializer.validated_data['recipes']]
+        queryset.remove_many(self.request.user, recipe_ids)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
     @action(detail=True,
             methods=['post', ],
             permission_classes=(IsAuthenticated,))
     def favorite(self, request, **kwargs):
-        recipe = get_object_or_404(Recipe, pk=kwargs['pk'])
-        serializer = RecipeShortSerializer(recipe,
-                                           data=request.data,
-                                           context={"request": request})
-        serializer.is_valid(raise_exception=True)
-        if Favorites.objects.filter(user=request.user,
-                                    recipe=recipe).exists():
-            return Response({'detail': 'Рецепт уже в избранном!'},
-                            status=status.HTTP_400_BAD_REQUEST)
-        Favorites.objects.create(user=request.user, recipe=recipe)
-        return Response(serializer.data,
-                        status=status.HTTP_201_CREATED)
+        return self.add_recipe(Favorites.objects,
+                               'Рецепт уже в избранном!')
 
     @favorite.mapping.delete
     def delete_item_from_favorite(self, request, **kwargs):
-        recipe = get_object_or_404(Recipe, pk=kwargs['pk'])
-        if not Favorites.objects.filter(user=request.user,
-                                        recipe=recipe).exists():
-            return Response({'detail': 'Рецепта не было в избранном!'
-                                       'Нечего удалять!'},
-                            status=status.HTTP_400_BAD_REQUEST)
-        Favorites.objects.filter(user=request.user,
-                                 recipe=recipe).delete()
-        return Response({'detail': 'Рецепт успешно удален из избранного.'},
-                        status=status.HTTP_204_NO_CONTENT)
+        return self.remove_recipe(
+            Favorites.objects,
+            'Рецепта не было в избранном!Нечего удалять!',
+            'Рецепт успешно удален из избранного.')
+
+    @action(detail=False,
+            methods=['post', ],
+            permission_classes=(IsAuthenticated,),
+            url_path='favorite',
+            url_name='favorite-batch')
+    def favorite_batch(self, request, **kwargs):
+        return self.add_recipes(Favorites.objects)
+
+    @favorite_batch.mapping.delete
+    def delete_favorite_batch(self, request, **kwargs):
+        return self.remove_recipes(Favorites.objects)
 
     @action(detail=True,
             methods=['post', ],
             permission_classes=(IsAuthenticated,))
     def shopping_cart(self, request, **kwargs):
-        recipe = get_object_or_404(Recipe, pk=kwargs['pk'])
-        serializer = RecipeShortSerializer(recipe,
-                                           data=request.data,
-                                           context={"request": request})
-        serializer.is_valid(raise_exception=True)
-        if ShoppingCart.objects.filter(user=request.user,
-                                       recipe=recipe).exists():
-            return Response({'detail': 'Рецепт уже в списке покупок!'},
-                            status=status.HTTP_400_BAD_REQUEST)
-        ShoppingCart.objects.create(user=request.user, recipe=recipe)
-        return Response(serializer.data,
-                        status=status.HTTP_201_CREATED)
+        return self.add_recipe(ShoppingCart.objects,
+                               'Рецепт уже в списке покупок!')
 
     @shopping_cart.mapping.delete
     def delete_item_from_shopping_cart(self, request, **kwargs):
-        recipe = get_object_or_404(Recipe, pk=kwargs['pk'])
-        if not ShoppingCart.objects.filter(user=request.user,
-                                           recipe=recipe).exists():
-            return Response({'detail': 'Рецепта нет в списке покупок!'},
-                            status=status.HTTP_400_BAD_REQUEST)
-        ShoppingCart.objects.filter(user=request.user,
-                                    recipe=recipe).delete()
-        return Response({'detail': 'Рецепт успешно удален из списка '
-                                   'покупок.'},
-                        status=status.HTTP_204_NO_CONTENT)
+        return self.remove_recipe(
+            ShoppingCart.objects,
+            'Рецепта нет в списке покупок!',
+            'Рецепт успешно удален из списка покупок.')
+
+    @action(detail=False,
+            methods=['post', ],
+            permission_classes=(IsAuthenticated,),
+            url_path='shopping_cart',
+            url_name='shopping-cart-batch')
+    def shopping_cart_batch(self, request, **kwargs):
+        return self.add_recipes(ShoppingCart.objects)
+
+    @shopping_cart_batch.mapping.delete
+    def delete_shopping_cart_batch(self, request, **kwargs):
+        return self.remove_recipes(ShoppingCart.objects)
 
     @action(detail=False,
             methods=['get'],
-            permission_classes=(IsAuthenticated,))
+            permission_classes=(IsAuthenticated,),
+            content_negotiation_class=IgnoreFormatNegotiation)
     def download_shopping_cart(self, request, **kwargs):
-        ingredients = (
-            IngredientCount.objects
-            .filter(recipe__shopping_list__user=request.user)
-            .values('ingredient')
-            .annotate(total_amount=Sum('amount'))
-            .values_list('ingredient__name', 'total_amount',
-                         'ingredient__measurement_unit')
-            .order_by('ingredient__name')
-        )
-        file_list = ['{} - {} {}.'.format(*ingredient)
-                     for ingredient in ingredients]
-        file = HttpResponse('Чтобы поесть купите'
-                            ' следующие продукты:\n' + '\n'.join(file_list),
-                            content_type='text/plain')
-        file['Content-Disposition'] = f'attachment; filename={FILE}'
+        export_format = request.query_params.get('format', 'txt')
+        if export_format not in EXPORT_FORMATS:
+            return Response(
+                {'detail': 'Доступные форматы: '
+                           f'{", ".join(EXPORT_FORMATS)}.'},
+                status=status.HTTP_400_BAD_REQUEST)
+        content_type, export = EXPORT_FORMATS[export_format]
+        file = StreamingHttpResponse(export(shopping_list(request.user)),
+                                     content_type=content_type)
+        file['Content-Disposition'] = (f'attachment; '
+                                       f'filename={FILE}.{export_format}')
         return file
+
+    @action(detail=False,
+            methods=['get'],
+            permission_classes=(IsAuthenticated,))
+    def feed(self, request, **kwargs):
+        """Рецепты авторов из подписок пользователя, новые сначала."""
+        paginator = TimelinePaginator()
+        entries = paginator.paginate(request)
+        recipes = self.get_queryset().in_bulk(
+            [recipe for _, recipe in entries])
+        serializer = self.get_serializer(
+            [recipes[recipe] for _, recipe in entries if recipe in recipes],
+            many=True)
+        return paginator.get_paginated_response(serializer.data)
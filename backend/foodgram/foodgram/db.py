@@ -0,0 +1,157 @@
+from django.db import IntegrityError, connections, transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+
+def change_counter(queryset, field, delta):
+    """Атомарное изменение счётчика field на delta, не ниже нуля."""
+    return queryset.update(**{field: Greatest(F(field) + delta, 0)})
+
+
+def save_fields(instance, derived, update_fields=None):
+    """update_fields для save() существующей записи без столбцов derived.
+
+    Производные столбцы (счётчики) меняются только атомарными UPDATE,
+    в объекте, загруженном раньше, их значения могли устареть. Новая
+    запись сохраняется целиком.
+    """
+    if instance._state.adding:
+        return update_fields
+    if update_fields is None:
+        deferred = instance.get_deferred_fields()
+        update_fields = [field.name for field in instance._meta.concrete_fields
+                         if not field.primary_key
+                         and field.attname not in deferred]
+    return [name for name in update_fields if name not in derived]
+
+
+def recount(queryset, field, related, related_field, aggregate=None):
+    """Сверка счётчика field с числом строк related.
+
+    Вместо числа строк можно задать другой aggregate, например Sum.
+    Исправляет только расходящиеся строки, возвращает их число.
+    """
+    actual = Coalesce(Subquery(
+        related.filter(**{related_field: OuterRef('pk')})
+        .order_by()
+        .values(related_field)
+        .annotate(count=aggregate or Count('pk'))
+        .values('count')
+    ), 0)
+    return (queryset
+            .annotate(actual=actual)
+            .exclude(**{field: F('actual')})
+            .update(**{field: actual}))
+
+
+def insert_link(queryset, owner, target_field, target_id):
+    """Создание записи-связи owner -> target без проверки на дубликат.
+
+    В PostgreSQL это один запрос INSERT ... ON CONFLICT DO NOTHING,
+    который заодно возвращает объект target. Возвращает target с
+    атрибутом created или None, если target не существует.
+    """
+    model = queryset.model
+    field = model._meta.get_field(target_field)
+    target_model = field.related_model
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return _insert_link_fallback(queryset, owner, target_field,
+                                     target_id)
+    quote = connection.ops.quote_name
+    target_table = quote(target_model._meta.db_table)
+    target_pk = quote(target_model._meta.pk.column)
+    sql = (
+        f'WITH inserted AS ('
+        f'INSERT INTO {quote(model._meta.db_table)} '
+        f'({quote(model._meta.get_field("user").column)}, '
+        f'{quote(field.column)}) '
+        f'SELECT %s, {target_pk} FROM {target_table} '
+        f'WHERE {target_pk} = %s '
+        f'ON CONFLICT DO NOTHING RETURNING 1) '
+        f'SELECT {target_table}.*, EXISTS (SELECT 1 FROM inserted) '
+        f'AS created FROM {target_table} WHERE {target_pk} = %s'
+    )
+    targets = list(target_model.objects.using(queryset.db).raw(
+        sql, [owner.pk, target_id, target_id]))
+    return targets[0] if targets else None
+
+
+def _insert_link_fallback(queryset, owner, target_field, target_id):
+    model = queryset.model
+    target_model = model._meta.get_field(target_field).related_model
+    target = target_model.objects.using(queryset.db).filter(
+        pk=target_id).first()
+    if target is None:
+        return None
+    try:
+        with transaction.atomic(using=queryset.db):
+            queryset.bulk_create(
+                [model(**{'user': owner, target_field: target})])
+        target.created = True
+    except IntegrityError:
+        target.created = False
+    return target
+
+
+def insert_links(queryset, owner, target_field, target_ids):
+    """Создание связей owner -> target_ids одним INSERT.
+
+    Существующие связи пропускаются. Возвращает id тех target,
+    для которых связь действительно добавлена.
+    """
+    if not target_ids:
+        return []
+    model = queryset.model
+    field = model._meta.get_field(target_field)
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        existing = set(queryset.filter(
+            user=owner, **{f'{field.attname}__in': target_ids}
+        ).values_list(field.attname, flat=True))
+        added = [pk for pk in dict.fromkeys(target_ids)
+                 if pk not in existing]
+        queryset.bulk_create(
+            [model(**{'user': owner, field.attname: pk}) for pk in added],
+            ignore_conflicts=True
+        )
+        return added
+    quote = connection.ops.quote_name
+    values = ', '.join(['(%s, %s)'] * len(target_ids))
+    sql = (
+        f'INSERT INTO {quote(model._meta.db_table)} '
+        f'({quote(model._meta.get_field("user").column)}, '
+        f'{quote(field.column)}) VALUES {values} '
+        f'ON CONFLICT DO NOTHING RETURNING {quote(field.column)}'
+    )
+    params = [value for pk in target_ids for value in (owner.pk, pk)]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def delete_links(queryset, target_field):
+    """Удаление связей queryset одним DELETE ... RETURNING.
+
+    Сигналы модели не отправляются. Возвращает id target удалённых связей.
+    """
+    model = queryset.model
+    field = model._meta.get_field(target_field)
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        with transaction.atomic(using=queryset.db):
+            rows = list(queryset.values_list('pk', field.attname))
+            model._base_manager.using(queryset.db).filter(
+                pk__in=[pk for pk, _ in rows])._raw_delete(queryset.db)
+        return [target for _, target in rows]
+    quote = connection.ops.quote_name
+    select, params = (queryset.values('pk').query
+                      .get_compiler(queryset.db).as_sql())
+    sql = (
+        f'DELETE FROM {quote(model._meta.db_table)} '
+        f'WHERE {quote(model._meta.pk.column)} IN ({select}) '
+        f'RETURNING {quote(field.column)}'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
@@ -0,0 +1,233 @@
+import logging
+import time
+from contextlib import ExitStack
+from threading import Lock
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db import connections
+from django.http import HttpResponse
+
+from foodgram.settings import (DEBUG, METRICS_DURATION_BUCKETS,
+                               METRICS_QUERY_BUCKETS, QUERY_BUDGET_RAISE)
+
+logger = logging.getLogger(__name__)
+
+
+class Histogram:
+    """Накопительная гистограмма в формате Prometheus."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.sum = 0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+        self.total += 1
+        self.sum += value
+
+    def lines(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+        yield f'{name}_bucket{{{labels},le="+Inf"}} {self.total}'
+        yield f'{name}_sum{{{labels}}} {self.sum}'
+        yield f'{name}_count{{{labels}}} {self.total}'
+
+
+class RouteMetrics:
+    def __init__(self):
+        self.duration = Histogram(METRICS_DURATION_BUCKETS)
+        self.queries = Histogram(METRICS_QUERY_BUCKETS)
+        self.db_seconds = 0.0
+        self.render_seconds = 0.0
+        self.responses = {}
+
+
+class Metrics:
+    """Метрики запросов по маршрутам, общие для процесса."""
+
+    def __init__(self):
+        self.lock = Lock()
+        self.routes = {}
+
+    def route(self, route):
+        if route not in self.routes:
+            self.routes[route] = RouteMetrics()
+        return self.routes[route]
+
+    def observe(self, route, status, duration, render):
+        with self.lock:
+            metrics = self.route(route)
+            metrics.duration.observe(duration)
+            metrics.render_seconds += render
+            metrics.responses[status] = metrics.responses.get(status, 0) + 1
+
+    def observe_queries(self, route, queries, db):
+        with self.lock:
+            metrics = self.route(route)
+            metrics.queries.observe(queries)
+            metrics.db_seconds += db
+
+    def render(self):
+        lines = [
+            '# TYPE foodgram_request_duration_seconds histogram',
+            '# TYPE foodgram_request_queries histogram',
+            '# TYPE foodgram_db_seconds_total counter',
+            '# TYPE foodgram_render_seconds_total counter',
+            '# TYPE foodgram_responses_total counter',
+        ]
+        with self.lock:
+            for route, metrics in sorted(self.routes.items()):
+                labels = f'route="{route}"'
+                lines.extend(metrics.duration.lines(
+                    'foodgram_request_duration_seconds', labels))
+                lines.extend(metrics.queries.lines(
+                    'foodgram_request_queries', labels))
+                lines.append(f'foodgram_db_seconds_total{{{labels}}} '
+                             f'{metrics.db_seconds}')
+                lines.append(f'foodgram_render_seconds_total{{{labels}}} '
+                             f'{metrics.render_seconds}')
+                for status, count in sorted(metrics.responses.items()):
+                    lines.append(f'foodgram_responses_total{{{labels},'
+                                 f'status="{status}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+
+
+class QueryTimer:
+    """execute_wrapper: число запросов к БД и время на них."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - started
+
+
+def view_action(view, method):
+    """Класс viewset и действие для метода или None, None."""
+    actions = getattr(view, 'actions', None)
+    if not actions:
+        return None, None
+    method = method.lower()
+    return view.cls, actions.get(method, method)
+
+
+def route_name(request):
+    """RecipeViewSet.list для viewset, имя маршрута для остальных view."""
+    match = request.resolver_match
+    if match is None:
+        return 'unmatched'
+    cls, action = view_action(match.func, request.method)
+    if cls is not None:
+        return f'{cls.__name__}.{action}'
+    return match.view_name or match.route
+
+
+def query_budget(view, method):
+    """Допустимое число запросов к БД из query_budgets viewset."""
+    cls, action = view_action(view, method)
+    return getattr(cls, 'query_budgets', {}).get(action)
+
+
+class QueryBudgetExceededError(Exception):
+    pass
+
+
+def check_query_budget(request, count):
+    match = request.resolver_match
+    if match is None:
+        return
+    budget = query_budget(match.func, request.method)
+    if budget is None or count <= budget:
+        return
+    message = (f'{route_name(request)}: {count} запросов к БД '
+               f'при бюджете {budget}')
+    if QUERY_BUDGET_RAISE:
+        raise QueryBudgetExceededError(message)
+    logger.warning(message)
+
+
+class MetricsMiddleware:
+    """Запросы к БД, время БД, рендеринга ответа и общее время запроса.
+
+    Пишет их в заголовок Server-Timing и в гистограммы по маршрутам,
+    которые отдаёт metrics_view. Рендеринг ответа DRF - это
+    сериализация в JSON; работа сериализаторов внутри view входит
+    в app. Под ASGI запросы к БД идут в других потоках и не
+    считаются, остаются общее время и рендеринг.
+
+    При DEBUG число запросов сверяется с query_budgets viewset.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timer = QueryTimer()
+        request.render_seconds = 0.0
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timer))
+            response = self.get_response(request)
+        self.record(request, response, time.perf_counter() - started, timer)
+        if DEBUG:
+            check_query_budget(request, timer.count)
+        return response
+
+    async def __acall__(self, request):
+        request.render_seconds = 0.0
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        self.record(request, response, time.perf_counter() - started)
+        return response
+
+    @staticmethod
+    def record(request, response, duration, timer=None):
+        render = request.render_seconds
+        timings = [f'render;dur={render * 1000:.1f}']
+        db = 0.0
+        if timer is not None:
+            db = timer.duration
+            metrics.observe_queries(route_name(request), timer.count, db)
+            timings.insert(0, f'db;dur={db * 1000:.1f};'
+                              f'desc="{timer.count} SQL"')
+        metrics.observe(route_name(request), response.status_code,
+                        duration, render)
+        timings.append(f'app;dur={(duration - db - render) * 1000:.1f}')
+        timings.append(f'total;dur={duration * 1000:.1f}')
+        response['Server-Timing'] = ', '.join(timings)
+
+    def process_template_response(self, request, response):
+        started = time.perf_counter()
+        response.render()
+        request.render_seconds += time.perf_counter() - started
+        return response
+
+
+def metrics_view(request):
+    """Метрики в текстовом формате Prometheus (только внутренняя сеть)."""
+    return HttpResponse(metrics.render(),
+                        content_type='text/plain; version=0.0.4')
@@ -54,6 +54,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'foodgram.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -99,6 +100,21 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND',
+                             'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+TOKEN_CACHE_SIZE = 10000
+TOKEN_CACHE_TIMEOUT = 60
+TOKEN_CACHE_SHARED = os.getenv('TOKEN_CACHE_SHARED')
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -152,7 +168,7 @@ AUTH_USER_MODEL = 'users.User'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.AllowAny',
@@ -169,8 +185,48 @@ DJOSER = {
     'PERMISSIONS': {
         'user': ['rest_framework.permissions.AllowAny']
     },
+    'SERIALIZERS': {
+        'user': 'users.serializers.UserViewSerializer',
+        'current_user': 'users.serializers.UserViewSerializer',
+    },
 }
 
 FILE = 'Ваш список покупок'
+# Включается в asgi.py: справочники отдаются асинхронными view.
+ASYNC_VIEWS = os.getenv('ASYNC_VIEWS') == 'true'
+IDEMPOTENT_PARAM = 'idempotent'
+RECIPE_BATCH_LIMIT = 100
+# Рецепты авторов, у которых подписчиков больше, в ленты подписок
+# не записываются, а читаются при запросе ленты. Пропущенное дописывает
+# команда rebuild_timelines, когда подписчиков станет не больше.
+TIMELINE_FANOUT_LIMIT = 10000
+TIMELINE_BATCH_SIZE = 1000
+# Тэг - один бит BigIntegerField Recipe.tags_mask (без знакового).
+TAG_MASK_BITS = 63
+# До скольких значений маски фильтр по тегам перечисляет через IN.
+TAG_MASK_IN_LIMIT = 64
+INGREDIENT_SEARCH_LIMIT = int(os.getenv('INGREDIENT_SEARCH_LIMIT', 50))
+SEARCH_CONFIG = 'russian'
+EXPORT_CHUNK_SIZE = 2000
+ESTIMATED_COUNT_THRESHOLD = 10000
+CATALOG_CACHE_TIMEOUT = 60 * 60 * 24
+RECIPE_CACHE_TIMEOUT = 60 * 60
+IMAGE_VARIANTS = {
+    'thumb': (200, 200),
+    'card': (600, 600),
+    'full': (1600, 1600),
+}
+IMAGE_UPLOAD_MAX_SIZE = 10 * 1024 * 1024
+IMAGE_UPLOAD_MAX_SIDE = 8000
+PDF_FONT = os.getenv('PDF_FONT',
+                     '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf')
 REGEX_VALID_USERNAME = '^[\w.@+-]+'
 REGEX_VALID_HEX_COLOR = '^#([a-fA-F0-9]{6})'
+
+# Границы гистограмм /metrics/: секунды и число запросов к БД.
+METRICS_DURATION_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+METRICS_QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+# При DEBUG превышение query_budgets у view пишется в лог,
+# с QUERY_BUDGET_RAISE=true - ошибка.
+QUERY_BUDGET_RAISE = os.getenv('QUERY_BUDGET_RAISE') == 'true'
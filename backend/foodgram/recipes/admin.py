@@ -1,13 +1,17 @@
+from django import forms
 from django.contrib import admin
+from django.contrib.admin.widgets import AutocompleteSelect
 
 from recipes import models
+from recipes.versions import bump_recipe_versions
 
 
 @admin.register(models.Ingredient)
 class IngredientAdmin(admin.ModelAdmin):
     list_display = ('pk', 'name', 'measurement_unit')
-    list_filter = ('name',)
+    list_filter = ('measurement_unit',)
     search_fields = ('name',)
+    ordering = ('name',)
 
 
 @admin.register(models.Tag)
@@ -17,37 +21,128 @@ class TagAdmin(admin.ModelAdmin):
     empty_value_display = '-пусто-'
 
 
+class SelectedAutocomplete(AutocompleteSelect):
+    """Автодополнение, выбранный объект которого задаёт форма.
+
+    Обычный виджет запрашивает выбранный объект из БД, в инлайне это
+    запрос на каждую строку.
+    """
+    selected = None
+
+    def optgroups(self, name, value, attr=None):
+        if (self.selected is None
+                or [str(item) for item in value] != [str(self.selected.pk)]):
+            return super().optgroups(name, value, attr)
+        options = []
+        if not self.is_required:
+            options.append(self.create_option(name, '', '', False, 0))
+        options.append(self.create_option(
+            name, self.selected.pk,
+            self.choices.field.label_from_instance(self.selected),
+            True, len(options)))
+        return [(None, options, 0)]
+
+
+class ItemForm(forms.ModelForm):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.ingredient_id is not None:
+            # Ингредиент загружен вместе со строкой (ItemInline).
+            widget = self.fields['ingredient'].widget.widget
+            widget.selected = self.instance.ingredient
+
+
 class ItemInline(admin.StackedInline):
     model = models.IngredientCount
+    form = ItemForm
     extra = 1
+    autocomplete_fields = ('ingredient',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('ingredient')
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name == 'ingredient':
+            kwargs['widget'] = SelectedAutocomplete(
+                db_field, self.admin_site, using=kwargs.get('using'))
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
 
 
 @admin.register(models.Recipe)
 class RecipeAdmin(admin.ModelAdmin):
     inlines = [ItemInline]
     list_display = ('pk', 'name', 'author', 'in_favorites')
+    list_select_related = ('author',)
     readonly_fields = ('in_favorites',)
-    list_filter = ('name', 'author', 'tags')
+    list_filter = ('tags',)
+    search_fields = ('name', 'author__username')
+    autocomplete_fields = ('author',)
+    show_full_result_count = False
     empty_value_display = '-пусто-'
 
-    @admin.display(description='В избранном')
+    @admin.display(description='В избранном', ordering='favorites_count')
     def in_favorites(self, obj):
-        return obj.favorite_recipe.count()
+        return obj.favorites_count
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        if change:
+            models.ShoppingListItem.objects.refresh_recipe(form.instance)
 
 
 @admin.register(models.IngredientCount)
 class IngredientCountAdmin(admin.ModelAdmin):
     list_display = ('pk', 'recipe', 'ingredient', 'amount')
-    list_editable = ('recipe', 'ingredient', 'amount')
+    list_editable = ('amount',)
+    list_select_related = ('recipe', 'ingredient')
+    autocomplete_fields = ('recipe', 'ingredient')
+    search_fields = ('recipe__name', 'ingredient__name')
+    show_full_result_count = False
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        recipes = [obj.recipe_id]
+        if 'recipe' in form.changed_data and form.initial.get('recipe'):
+            recipes.append(form.initial['recipe'])
+        self.recipes_changed(recipes)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        self.recipes_changed([obj.recipe_id])
+
+    def delete_queryset(self, request, queryset):
+        recipes = list(queryset.values_list('recipe', flat=True).distinct())
+        super().delete_queryset(request, queryset)
+        self.recipes_changed(recipes)
+
+    def recipes_changed(self, recipes):
+        for recipe in recipes:
+            models.ShoppingListItem.objects.refresh_recipe(recipe)
+        bump_recipe_versions(recipes)
+
+
+class LinkAdmin(admin.ModelAdmin):
+    """Связь пользователя с объектом.
+
+    Связь не перепривязывается: от неё зависят счётчики и списки
+    покупок, поэтому её можно только создать или удалить.
+    """
+    list_display = ('pk', 'user', 'recipe')
+    list_select_related = ('user', 'recipe')
+    autocomplete_fields = ('user', 'recipe')
+    show_full_result_count = False
+
+    def get_readonly_fields(self, request, obj=None):
+        if obj is not None:
+            return self.autocomplete_fields
+        return super().get_readonly_fields(request, obj)
 
 
 @admin.register(models.Favorites)
-class FavoritesAdmin(admin.ModelAdmin):
-    list_display = ('pk', 'user', 'recipe')
-    list_editable = ('user', 'recipe')
+class FavoritesAdmin(LinkAdmin):
+    search_fields = ('user__username', 'recipe__name')
 
 
 @admin.register(models.ShoppingCart)
-class ShoppingCartAdmin(admin.ModelAdmin):
-    list_display = ('pk', 'user', 'recipe')
-    list_editable = ('user', 'recipe')
+class ShoppingCartAdmin(LinkAdmin):
+    search_fields = ('user__username', 'recipe__name')
@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core.checks import Warning, register
+
+LOCAL_CACHES = ('django.core.cache.backends.locmem.LocMemCache',
+                'django.core.cache.backends.dummy.DummyCache')
+
+
+@register()
+def shared_cache_check(app_configs, **kwargs):
+    """Версии ключей кэша (recipes/versions.py) должны быть общими.
+
+    В кэше процесса изменения из других процессов backend и команд
+    manage.py не сбрасывают кэш справочников и рецептов.
+    """
+    if settings.CACHES['default']['BACKEND'] not in LOCAL_CACHES:
+        return []
+    return [Warning(
+        'Кэш по умолчанию не общий для процессов: изменения из других '
+        'процессов не сбрасывают кэш справочников и рецептов.',
+        hint='Задайте CACHE_BACKEND и CACHE_LOCATION (Redis).',
+        id='recipes.W001',
+    )]
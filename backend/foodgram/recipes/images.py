@@ -0,0 +1,71 @@
+import hashlib
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+from foodgram.settings import IMAGE_VARIANTS
+
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 6}),
+    'jpeg': ('JPEG', {'quality': 85, 'optimize': True, 'progressive': True}),
+}
+
+
+def variant_name(image_hash, variant, extension):
+    return f'recipes/{image_hash[:2]}/{image_hash}/{variant}.{extension}'
+
+
+def variant_urls(image_hash):
+    """Пути всех вариантов картинки: {variant: {format: url}}."""
+    return {
+        variant: {
+            extension: default_storage.url(
+                variant_name(image_hash, variant, extension))
+            for extension in FORMATS
+        }
+        for variant in IMAGE_VARIANTS
+    }
+
+
+def open_rgb(file):
+    image = ImageOps.exif_transpose(Image.open(file))
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def store_variants(file):
+    """Сохраняет уменьшенные копии картинки под хэшем её содержимого.
+
+    Одинаковые картинки обрабатываются и хранятся один раз.
+    Возвращает хэш и путь к полноразмерному JPEG.
+    """
+    hasher = hashlib.sha256()
+    file.seek(0)
+    for chunk in file.chunks():
+        hasher.update(chunk)
+    image_hash = hasher.hexdigest()
+    full = variant_name(image_hash, 'full', 'jpeg')
+    if default_storage.exists(full):
+        return image_hash, full
+    file.seek(0)
+    image = open_rgb(file)
+    # Полноразмерный JPEG пишется последним: по нему проверяется,
+    # что все варианты уже есть.
+    for variant, size in sorted(IMAGE_VARIANTS.items(),
+                                key=lambda item: item[0] == 'full'):
+        resized = image.copy()
+        resized.thumbnail(size, Image.LANCZOS)
+        for extension, (image_format, options) in FORMATS.items():
+            name = variant_name(image_hash, variant, extension)
+            if default_storage.exists(name):
+                continue
+            buffer = BytesIO()
+            resized.save(buffer, image_format, **options)
+            default_storage.save(name, ContentFile(buffer.getvalue()))
+    return image_hash, full
@@ -0,0 +1,62 @@
+from bisect import bisect_left
+from threading import Lock
+
+from recipes.models import Ingredient
+from recipes.versions import get_catalog_version
+
+
+class IngredientIndex:
+    """Отсортированный индекс ингредиентов для поиска по началу названия.
+
+    Строится лениво при первом обращении и перестраивается, когда
+    меняется версия каталога. Индекс локален для процесса.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._keys = None
+        self._items = None
+        self._version = None
+
+    def _build(self):
+        rows = sorted(
+            Ingredient.objects.values_list('name', 'measurement_unit', 'id'),
+            key=lambda row: (row[0].casefold(), row[1], row[2])
+        )
+        keys = [name.casefold() for name, _, _ in rows]
+        items = [{'id': pk, 'name': name, 'measurement_unit': unit}
+                 for name, unit, pk in rows]
+        return keys, items
+
+    def _ensure(self):
+        version = get_catalog_version()
+        keys, items = self._keys, self._items
+        if self._version != version:
+            with self._lock:
+                if self._version != version:
+                    self._keys, self._items = self._build()
+                    self._version = version
+                keys, items = self._keys, self._items
+        return keys, items
+
+    def all(self):
+        return list(self._ensure()[1])
+
+    def search(self, prefix, limit=None):
+        """Ингредиенты, название которых начинается с prefix.
+
+        Точные совпадения идут первыми, остальные - по алфавиту.
+        """
+        keys, items = self._ensure()
+        prefix = prefix.casefold()
+        result = []
+        position = bisect_left(keys, prefix)
+        while position < len(keys) and keys[position].startswith(prefix):
+            if limit is not None and len(result) >= limit:
+                break
+            result.append(items[position])
+            position += 1
+        return result
+
+
+ingredient_index = IngredientIndex()
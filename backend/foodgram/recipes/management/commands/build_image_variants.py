@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from recipes.images import store_variants
+from recipes.models import Recipe
+from recipes.versions import bump_recipe_versions
+
+
+class Command(BaseCommand):
+    help = "Уменьшенные копии картинок для рецептов, загруженных ранее"
+
+    def handle(self, *args, **options):
+        processed = []
+        recipes = Recipe.objects.filter(image_hash='').only('pk', 'image')
+        for recipe in recipes.iterator():
+            with recipe.image.open('rb') as file:
+                image_hash, name = store_variants(file)
+            Recipe.objects.filter(pk=recipe.pk).update(image_hash=image_hash,
+                                                       image=name)
+            processed.append(recipe.pk)
+        bump_recipe_versions(processed)
+        self.stdout.write(f"Обработано рецептов: {len(processed)}.")
@@ -0,0 +1,173 @@
+import random
+from io import BytesIO
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+from PIL import Image
+
+from recipes.images import store_variants
+from recipes.models import (Favorites, Ingredient, IngredientCount, Recipe,
+                            ShoppingCart, ShoppingListItem, Tag, User)
+from recipes.versions import bump_catalog_version, bump_recipe_versions
+from users.models import Subscribe, Timeline
+
+TAGS = (
+    ('Завтрак', '#E26C2D', 'breakfast'),
+    ('Обед', '#49B64E', 'lunch'),
+    ('Ужин', '#8775D2', 'dinner'),
+)
+WORDS = ('суп', 'салат', 'пирог', 'рагу', 'каша', 'омлет', 'паста',
+         'запеканка', 'котлеты', 'блины', 'плов', 'соус')
+
+
+class Zipf:
+    """Выбор из items с весом 1/ранг: немногие элементы популярны."""
+
+    def __init__(self, items, rng):
+        self.items = list(items)
+        rng.shuffle(self.items)
+        self.weights = list(accumulate(
+            1 / rank for rank in range(1, len(self.items) + 1)))
+        self.rng = rng
+
+    def sample(self, count, exclude=None):
+        """До count разных элементов, кроме exclude."""
+        count = min(count, len(self.items) - (exclude is not None))
+        chosen = set()
+        while len(chosen) < count:
+            item = self.rng.choices(self.items, cum_weights=self.weights)[0]
+            if item != exclude:
+                chosen.add(item)
+        return chosen
+
+
+class Command(BaseCommand):
+    help = ("Генерация пользователей, рецептов, избранного, корзин "
+            "и подписок для нагрузочного тестирования")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--recipes', type=int, default=5,
+                            help='Рецептов на пользователя в среднем')
+        parser.add_argument('--favorites', type=int, default=20,
+                            help='Избранных рецептов на пользователя')
+        parser.add_argument('--cart', type=int, default=3,
+                            help='Рецептов в корзине на пользователя')
+        parser.add_argument('--subscriptions', type=int, default=10,
+                            help='Подписок на пользователя')
+        parser.add_argument('--password', default='generated-password')
+        parser.add_argument('--seed', type=int)
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        ingredients = list(Ingredient.objects.values_list('pk', flat=True))
+        if not ingredients:
+            raise CommandError(
+                'Нет ингредиентов, сначала выполните load_ingredients')
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        with transaction.atomic():
+            tags = self.tags()
+            users = self.users(options['users'], options['password'])
+            recipes = self.recipes(users, options['recipes'])
+            self.recipe_links(recipes, tags, ingredients)
+            recipe_choice = Zipf(recipes, self.rng)
+            favorited = self.links(Favorites, users, recipe_choice,
+                                   'recipe_id', options['favorites'])
+            self.links(ShoppingCart, users, recipe_choice, 'recipe_id',
+                       options['cart'])
+            self.links(Subscribe, users, Zipf(users, self.rng),
+                       'author_id', options['subscriptions'])
+            Recipe.objects.filter(pk__in=recipes).update_tags_mask()
+            Recipe.objects.filter(pk__in=recipes).update_search_vector()
+            ShoppingListItem.objects.refresh(users)
+            call_command('reconcile_counters', stdout=self.stdout)
+            # После счётчиков: по числу подписчиков выбираются авторы,
+            # которых нет в лентах.
+            Timeline.objects.fill(Subscribe.objects.filter(user__in=users))
+            bump_recipe_versions(favorited)
+        self.stdout.write(
+            f"Создано: пользователей {len(users)}, рецептов {len(recipes)}.")
+
+    def bulk_create(self, model, objects):
+        return model.objects.bulk_create(
+            objects, batch_size=self.batch_size, ignore_conflicts=True)
+
+    def tags(self):
+        tags = list(Tag.objects.values_list('pk', flat=True))
+        if tags:
+            return tags
+        self.bulk_create(Tag, [
+            Tag(name=name, color=color, slug=slug, mask=1 << bit)
+            for bit, (name, color, slug) in enumerate(TAGS)
+        ])
+        bump_catalog_version()
+        return list(Tag.objects.values_list('pk', flat=True))
+
+    def users(self, count, password):
+        # Пароль хэшируется один раз: make_password медленный намеренно.
+        password = make_password(password)
+        start = User.objects.aggregate(last=Max('pk'))['last'] or 0
+        users = User.objects.bulk_create(
+            (User(username=f'user{number}',
+                  email=f'user{number}@example.com',
+                  first_name='Имя', last_name='Фамилия',
+                  password=password)
+             for number in range(start + 1, start + count + 1)),
+            batch_size=self.batch_size,
+        )
+        return [user.pk for user in users]
+
+    def recipes(self, users, per_user):
+        # Одна картинка на все рецепты: варианты хранятся по хэшу.
+        buffer = BytesIO()
+        Image.new('RGB', (600, 400), '#E26C2D').save(buffer, 'JPEG')
+        image_hash, image = store_variants(ContentFile(buffer.getvalue()))
+        authors = Zipf(users, self.rng)
+        recipes = Recipe.objects.bulk_create(
+            (Recipe(author_id=authors.sample(1).pop(),
+                    name=' '.join(self.rng.sample(WORDS, 2)).capitalize(),
+                    text='Сгенерированный рецепт.',
+                    cooking_time=self.rng.randint(5, 180),
+                    image=image, image_hash=image_hash)
+             for _ in range(len(users) * per_user)),
+            batch_size=self.batch_size,
+        )
+        return [recipe.pk for recipe in recipes]
+
+    def recipe_links(self, recipes, tags, ingredients):
+        ingredient_choice = Zipf(ingredients, self.rng)
+        self.bulk_create(Recipe.tags.through, [
+            Recipe.tags.through(recipe_id=recipe, tag_id=tag)
+            for recipe in recipes
+            for tag in self.rng.sample(tags, self.rng.randint(1, len(tags)))
+        ])
+        self.bulk_create(IngredientCount, [
+            IngredientCount(recipe_id=recipe, ingredient_id=ingredient,
+                            amount=self.rng.randint(1, 500))
+            for recipe in recipes
+            for ingredient in ingredient_choice.sample(
+                self.rng.randint(3, 12))
+        ])
+
+    def links(self, model, users, choice, target, average):
+        """В среднем average связей на пользователя с объектами choice.
+
+        Возвращает id затронутых объектов.
+        """
+        targets = set()
+        objects = []
+        for user in users:
+            # На себя подписаться нельзя.
+            chosen = choice.sample(self.rng.randint(0, average * 2),
+                                   user if model is Subscribe else None)
+            targets |= chosen
+            objects.extend(model(user_id=user, **{target: pk})
+                           for pk in chosen)
+        self.bulk_create(model, objects)
+        return targets
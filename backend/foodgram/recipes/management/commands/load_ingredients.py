@@ -1,33 +1,80 @@
 import csv
+import json
 import os
+from itertools import islice
 
-from django.core.management.base import BaseCommand
-from progress.bar import IncrementalBar
+from django.core.management.base import BaseCommand, CommandError
+from progress.counter import Counter
 
 from foodgram import settings
 from recipes.models import Ingredient
+from recipes.versions import bump_catalog_version
 
+HEADER = ['name', 'measurement_unit']
 
-def ingredient_create(row):
-    Ingredient.objects.get_or_create(
-        name=row[0],
-        measurement_unit=row[1]
-    )
+
+def read_csv(file):
+    reader = csv.reader(file)
+    for row in reader:
+        if row == HEADER:
+            continue
+        yield row[0], row[1]
+
+
+def read_json(file):
+    for item in json.load(file):
+        yield item['name'], item['measurement_unit']
+
+
+READERS = {
+    '.csv': read_csv,
+    '.json': read_json,
+}
+
+
+def batches(rows, size):
+    rows = iter(rows)
+    while batch := list(islice(rows, size)):
+        yield batch
 
 
 class Command(BaseCommand):
     help = "Загрузка ингредиентов в БД"
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?',
+            default=os.path.join(settings.BASE_DIR, 'ingredients.csv'),
+            help='Файл .csv или .json с ингредиентами')
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Количество строк в одном INSERT')
+
     def handle(self, *args, **options):
-        path = os.path.join(settings.BASE_DIR, 'ingredients.csv')
-        with open(path, 'r', encoding='utf-8') as file:
-            row_count = sum(1 for _ in file)
+        path = options['path']
+        reader = READERS.get(os.path.splitext(path)[1].lower())
+        if reader is None:
+            raise CommandError('Поддерживаются только файлы .csv и .json')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть не меньше 1')
+        before = Ingredient.objects.count()
+        total = 0
         with open(path, 'r', encoding='utf-8') as file:
-            reader = csv.reader(file)
-            bar = IncrementalBar('ingredients.csv'.ljust(17), max=row_count)
-            next(reader)
-            for row in reader:
-                bar.next()
-                ingredient_create(row)
-            bar.finish()
-        self.stdout.write("Ингредиенты успешно загружены!!!")
+            counter = Counter(os.path.basename(path).ljust(17))
+            rows = ((name.strip(), unit.strip())
+                    for name, unit in reader(file))
+            for batch in batches(rows, options['batch_size']):
+                Ingredient.objects.bulk_create(
+                    [Ingredient(name=name, measurement_unit=unit)
+                     for name, unit in batch],
+                    ignore_conflicts=True
+                )
+                total += len(batch)
+                counter.next(len(batch))
+            counter.finish()
+        inserted = Ingredient.objects.count() - before
+        if inserted:
+            bump_catalog_version()
+        self.stdout.write(
+            f"Ингредиенты загружены: добавлено {inserted}, "
+            f"пропущено {total - inserted}.")
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.models import ShoppingListItem, User
+
+
+class Command(BaseCommand):
+    help = "Пересчёт списков покупок пользователей"
+
+    def add_arguments(self, parser):
+        parser.add_argument('users', nargs='*', type=int,
+                            help='id пользователей (по умолчанию все)')
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        if options['users']:
+            users = User.objects.filter(pk__in=options['users'])
+        else:
+            ShoppingListItem.objects.all().delete()
+            users = User.objects.filter(shopping_list__isnull=False)
+        ShoppingListItem.objects.refresh(users.values('pk').distinct())
+        self.stdout.write("Списки покупок пересчитаны.")
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from users.models import Timeline, User
+
+
+class Command(BaseCommand):
+    help = ("Дозапись в ленты подписок рецептов, пропущенных, пока у автора "
+            "было больше TIMELINE_FANOUT_LIMIT подписчиков")
+
+    def add_arguments(self, parser):
+        parser.add_argument('authors', nargs='*', type=int,
+                            help='id авторов (по умолчанию все, у кого '
+                                 'рецепты не разосланы в ленты)')
+
+    def handle(self, *args, **options):
+        authors = options['authors'] or (
+            User.objects.filter(timeline_pending=True)
+            .values_list('pk', flat=True))
+        done = Timeline.objects.catch_up(list(authors))
+        self.stdout.write(f"Ленты подписок дописаны, авторов: {done}.")
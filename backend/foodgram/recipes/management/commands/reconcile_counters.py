@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from foodgram.db import recount
+from recipes.models import Favorites, Recipe, User
+from users.models import Subscribe
+
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorites, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'subscribers_count', Subscribe, 'author'),
+)
+
+
+class Command(BaseCommand):
+    help = "Сверка счётчиков избранного, рецептов и подписчиков"
+
+    def handle(self, *args, **options):
+        for model, field, related, related_field in COUNTERS:
+            fixed = recount(model.objects.all(), field,
+                            related.objects.all(), related_field)
+            self.stdout.write(
+                f"{model._meta.verbose_name_plural}.{field}: "
+                f"исправлено {fixed}.")
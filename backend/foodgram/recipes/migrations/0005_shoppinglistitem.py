@@ -0,0 +1,51 @@
+# Generated by Django 4.2 on 2026-10-18 02:21
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_shopping_lists(apps, schema_editor):
+    IngredientCount = apps.get_model('recipes', 'IngredientCount')
+    ShoppingListItem = apps.get_model('recipes', 'ShoppingListItem')
+    db = schema_editor.connection.alias
+    totals = (IngredientCount.objects.using(db)
+              .filter(recipe__shopping_list__isnull=False)
+              .values('recipe__shopping_list__user', 'ingredient')
+              .annotate(total_amount=models.Sum('amount'))
+              .order_by())
+    ShoppingListItem.objects.using(db).bulk_create(
+        ShoppingListItem(user_id=row['recipe__shopping_list__user'],
+                         ingredient_id=row['ingredient'],
+                         total_amount=row['total_amount'])
+        for row in totals
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0004_recipe_search_vector'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingListItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_amount', models.PositiveIntegerField(verbose_name='Количество')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_list_items', to='recipes.ingredient')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_list_items', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Продукт в списке покупок',
+                'verbose_name_plural': 'Списки покупок',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='shoppinglistitem',
+            constraint=models.UniqueConstraint(fields=('user', 'ingredient'), name='unique_shopping_list_item'),
+        ),
+        migrations.RunPython(fill_shopping_lists, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.2 on 2026-10-18 02:35
+
+from django.db import migrations, models
+
+from foodgram.db import recount
+
+
+def fill_counters(apps, schema_editor):
+    Favorites = apps.get_model('recipes', 'Favorites')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Subscribe = apps.get_model('users', 'Subscribe')
+    User = apps.get_model('users', 'User')
+    db = schema_editor.connection.alias
+    recount(Recipe.objects.using(db), 'favorites_count',
+            Favorites.objects.using(db), 'recipe')
+    recount(User.objects.using(db), 'recipes_count',
+            Recipe.objects.using(db), 'author')
+    recount(User.objects.using(db), 'subscribers_count',
+            Subscribe.objects.using(db), 'author')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_recipe_image_hash'),
+        ('users', '0002_user_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В избранном'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-favorites_count', '-pub_date'], name='recipe_popularity'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
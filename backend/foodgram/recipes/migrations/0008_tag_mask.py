@@ -0,0 +1,49 @@
+# Generated by Django 4.2 on 2026-10-18 02:51
+
+from django.db import migrations, models
+from django.db.models import Sum
+
+from foodgram.db import recount
+
+
+def fill_masks(apps, schema_editor):
+    Tag = apps.get_model('recipes', 'Tag')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    db = schema_editor.connection.alias
+    tags = list(Tag.objects.using(db).order_by('pk'))
+    for bit, tag in enumerate(tags):
+        tag.mask = 1 << bit
+    Tag.objects.using(db).bulk_update(tags, ['mask'])
+    recount(Recipe.objects.using(db), 'tags_mask',
+            Recipe.tags.through.objects.using(db), 'recipe',
+            Sum('tag__mask'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_recipe_favorites_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='tags_mask',
+            field=models.BigIntegerField(default=0, editable=False, verbose_name='Тэги (сумма Tag.mask)'),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='mask',
+            field=models.BigIntegerField(editable=False, null=True, verbose_name='Бит тэга в Recipe.tags_mask'),
+        ),
+        migrations.RunPython(fill_masks, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='tag',
+            name='mask',
+            field=models.BigIntegerField(editable=False, unique=True, verbose_name='Бит тэга в Recipe.tags_mask'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['tags_mask', '-pub_date'], name='recipe_tags_mask'),
+        ),
+    ]
@@ -1,8 +1,18 @@
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
+from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator, RegexValidator
-from django.db import models
+from django.db import connections, models, transaction
+from django.db.models import (BooleanField, Exists, F, Max, OuterRef, Prefetch,
+                              Sum, Value, Window)
+from django.db.models.functions import RowNumber
 
-from foodgram.settings import REGEX_VALID_HEX_COLOR, REGEX_VALID_USERNAME
+from foodgram.db import (change_counter, delete_links, insert_link,
+                         insert_links, recount, save_fields)
+from foodgram.settings import (REGEX_VALID_HEX_COLOR, REGEX_VALID_USERNAME,
+                               SEARCH_CONFIG, TAG_MASK_BITS, TAG_MASK_IN_LIMIT)
+from recipes.images import store_variants, variant_urls
 
 User = get_user_model()
 
@@ -37,10 +47,29 @@ class Tag(models.Model):
         ],
         unique=True
     )
+    mask = models.BigIntegerField(
+        unique=True,
+        editable=False,
+        verbose_name='Бит тэга в Recipe.tags_mask',
+    )
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        if self.mask is None:
+            self.mask = free_tag_mask()
+        super().save(*args, **kwargs)
+
+
+def free_tag_mask():
+    """Первый свободный бит для нового тега."""
+    used = set(Tag.objects.values_list('mask', flat=True))
+    for bit in range(TAG_MASK_BITS):
+        if 1 << bit not in used:
+            return 1 << bit
+    raise ValidationError(f'Тэгов может быть не больше {TAG_MASK_BITS}.')
+
 
 class Ingredient(models.Model):
     name = models.CharField(
@@ -66,6 +95,93 @@ class Ingredient(models.Model):
         ]
 
 
+def recipe_prefetch_lookups():
+    """Связи для полного представления рецепта: теги и ингредиенты."""
+    return (
+        'tags',
+        Prefetch(
+            'recipes',
+            queryset=IngredientCount.objects.select_related('ingredient')
+        ),
+    )
+
+
+class RecipeQuerySet(models.QuerySet):
+    def with_related(self):
+        """Автор, теги и ингредиенты одним набором запросов."""
+        return self.select_related('author').prefetch_related(
+            *recipe_prefetch_lookups())
+
+    def with_user_flags(self, user):
+        """Флаги избранного, корзины и подписки на автора для user."""
+        if not user.is_authenticated:
+            false = Value(False, output_field=BooleanField())
+            return self.annotate(is_favorited=false,
+                                 is_in_shopping_cart=false,
+                                 author_is_subscribed=false)
+        return self.annotate(
+            is_favorited=Exists(Favorites.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            author_is_subscribed=Exists(user.subscriber.filter(
+                author=OuterRef('author'))),
+        )
+
+    def update_tags_mask(self):
+        """Пересчёт tags_mask по тегам рецептов."""
+        return recount(self, 'tags_mask', Recipe.tags.through.objects.all(),
+                       'recipe', Sum('tag__mask'))
+
+    def favorited_by(self, user):
+        return self.filter(favorite_recipe__user=user)
+
+    def in_shopping_cart_of(self, user):
+        return self.filter(shopping_list__user=user)
+
+    def popular(self):
+        """Сначала рецепты, которые чаще добавляют в избранное."""
+        return self.order_by('-favorites_count', '-pub_date', '-id')
+
+    def latest_per_author(self, limit):
+        """Не больше limit последних рецептов каждого автора."""
+        return self.annotate(row_number=Window(
+            RowNumber(),
+            partition_by=F('author'),
+            order_by=(F('pub_date').desc(), F('id').desc()),
+        )).filter(row_number__lte=limit)
+
+    def with_tags(self, tags, highest=None):
+        """Рецепты хотя бы с одним из tags, без JOIN с тегами.
+
+        highest - наибольшая маска среди всех тегов, если уже известна.
+        """
+        mask = sum(tag.mask for tag in tags)
+        if highest is None:
+            highest = (Tag.objects.aggregate(highest=Max('mask'))['highest']
+                       or 0)
+        if highest * 2 <= TAG_MASK_IN_LIMIT:
+            # Тегов мало: все подходящие значения маски перечисляются,
+            # и поиск идёт по индексу recipe_tags_mask.
+            return self.filter(tags_mask__in=[
+                value for value in range(1, highest * 2) if value & mask])
+        return self.with_tag_bits(mask)
+
+    def with_tag_bits(self, mask):
+        """Рецепты, у которых в tags_mask есть хотя бы один бит mask."""
+        return (self.alias(tag_bits=F('tags_mask').bitand(mask))
+                .exclude(tag_bits=0))
+
+    def update_search_vector(self):
+        """Пересчёт полнотекстового вектора (только PostgreSQL)."""
+        if connections[self.db].vendor != 'postgresql':
+            return 0
+        return self.update(search_vector=(
+            SearchVector('name', weight='A', config=SEARCH_CONFIG)
+            + SearchVector('text', weight='B', config=SEARCH_CONFIG)
+        ))
+
+
 class Recipe(models.Model):
     pub_date = models.DateTimeField(auto_now_add=True)
 
@@ -100,14 +216,119 @@ class Recipe(models.Model):
         through='IngredientCount',
         through_fields=('recipe', 'ingredient'),
     )
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False,
+    )
+    image_hash = models.CharField(
+        max_length=64,
+        blank=True,
+        editable=False,
+        verbose_name='Хэш картинки',
+    )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В избранном',
+    )
+    tags_mask = models.BigIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Тэги (сумма Tag.mask)',
+    )
+
+    objects = RecipeQuerySet.as_manager()
+
+    # Меняются только запросами UPDATE, save() их не перезаписывает.
+    derived_fields = ('favorites_count', 'tags_mask', 'search_vector')
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        if self.image and not self.image._committed:
+            self.image_hash, self.image = store_variants(self.image)
+        kwargs['update_fields'] = save_fields(
+            self, self.derived_fields, kwargs.get('update_fields'))
+        super().save(*args, **kwargs)
+
+    @property
+    def images(self):
+        if not self.image_hash:
+            return None
+        return variant_urls(self.image_hash)
+
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ['-pub_date']
+        indexes = [
+            GinIndex(fields=['search_vector'], name='recipe_search_vector'),
+            models.Index(fields=['-favorites_count', '-pub_date'],
+                         name='recipe_popularity'),
+            models.Index(fields=['tags_mask', '-pub_date'],
+                         name='recipe_tags_mask'),
+        ]
+
+
+class UserRecipeQuerySet(models.QuerySet):
+    """Рецепты пользователя: избранное или корзина.
+
+    Добавление и удаление идут в обход сигналов модели, одним запросом
+    на всю пачку рецептов; производные данные обновляет links_changed.
+    """
+
+    def add(self, user, recipe_id):
+        """Добавляет рецепт пользователю, повтор не считается ошибкой.
+
+        Возвращает рецепт с атрибутом created или None, если его нет.
+        """
+        with transaction.atomic(using=self.db):
+            recipe = insert_link(self, user, 'recipe', recipe_id)
+            if recipe is not None and recipe.created:
+                self.links_changed(user, [recipe.pk], 1)
+        return recipe
+
+    def add_many(self, user, recipes):
+        """Добавляет рецепты одним INSERT, уже добавленные пропускаются."""
+        with transaction.atomic(using=self.db):
+            added = insert_links(self, user, 'recipe',
+                                 [recipe.pk for recipe in recipes])
+            if added:
+                self.links_changed(user, added, 1)
+
+    def remove(self, user, recipe_id):
+        """Удаляет рецепт у пользователя. Возвращает, была ли запись."""
+        return bool(self.remove_many(user, [recipe_id]))
+
+    def remove_many(self, user, recipe_ids=None):
+        """Удаляет рецепты recipe_ids или все. Возвращает их число."""
+        links = self.filter(user=user)
+        if recipe_ids is not None:
+            links = links.filter(recipe_id__in=recipe_ids)
+        with transaction.atomic(using=self.db):
+            removed = delete_links(links, 'recipe')
+            if removed:
+                self.links_changed(user, removed, -1)
+        return len(removed)
+
+    def links_changed(self, user, recipe_ids, delta):
+        """Рецепты recipe_ids добавлены (delta=1) или удалены (-1)."""
+
+
+class FavoritesQuerySet(UserRecipeQuerySet):
+    def links_changed(self, user, recipe_ids, delta):
+        change_counter(Recipe.objects.filter(pk__in=recipe_ids),
+                       'favorites_count', delta)
+
+
+class ShoppingCartQuerySet(UserRecipeQuerySet):
+    def links_changed(self, user, recipe_ids, delta):
+        ShoppingListItem.objects.refresh(
+            [user.pk],
+            IngredientCount.objects.filter(
+                recipe__in=recipe_ids).values('ingredient')
+        )
 
 
 class Favorites(models.Model):
@@ -122,6 +343,8 @@ class Favorites(models.Model):
         on_delete=models.CASCADE,
     )
 
+    objects = FavoritesQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Избранное'
         verbose_name_plural = 'Избранное'
@@ -172,6 +395,8 @@ class ShoppingCart(models.Model):
         related_name='shopping_list'
     )
 
+    objects = ShoppingCartQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Корзина'
         verbose_name_plural = 'Корзина'
@@ -184,3 +409,63 @@ class ShoppingCart(models.Model):
 
     def __str__(self):
         return f'{self.user.username} - {self.recipe.name}'
+
+
+class ShoppingListItemQuerySet(models.QuerySet):
+    def refresh(self, users, ingredients=None):
+        """Пересчёт итогов корзины для users.
+
+        Если ingredients не заданы, пересчитывается весь список покупок.
+        """
+        items = self.filter(user__in=users)
+        totals = IngredientCount.objects.filter(
+            recipe__shopping_list__user__in=users)
+        if ingredients is not None:
+            items = items.filter(ingredient__in=ingredients)
+            totals = totals.filter(ingredient__in=ingredients)
+        totals = (totals
+                  .values('recipe__shopping_list__user', 'ingredient')
+                  .annotate(total_amount=Sum('amount'))
+                  .order_by())
+        with transaction.atomic(using=self.db):
+            items.delete()
+            self.bulk_create(
+                ShoppingListItem(user_id=row['recipe__shopping_list__user'],
+                                 ingredient_id=row['ingredient'],
+                                 total_amount=row['total_amount'])
+                for row in totals
+            )
+
+    def refresh_recipe(self, recipe, ingredients=None):
+        """Пересчёт у всех, у кого recipe лежит в корзине."""
+        self.refresh(User.objects.filter(shopping_list__recipe=recipe),
+                     ingredients)
+
+
+class ShoppingListItem(models.Model):
+    """Итоговое количество ингредиента в списке покупок пользователя."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items'
+    )
+    total_amount = models.PositiveIntegerField(
+        verbose_name='Количество'
+    )
+
+    objects = ShoppingListItemQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Продукт в списке покупок'
+        verbose_name_plural = 'Списки покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_list_item'
+            )
+        ]
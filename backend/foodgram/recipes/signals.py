@@ -0,0 +1,143 @@
+from django.db import transaction
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+
+from foodgram.db import change_counter
+from recipes.models import (Favorites, Ingredient, IngredientCount, Recipe,
+                            ShoppingCart, ShoppingListItem, Tag, User)
+from recipes.versions import (bump_catalog_version, bump_recipe_versions,
+                              bump_user_version)
+from users.models import Subscribe, Timeline
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def change_catalog_version(sender, **kwargs):
+    bump_catalog_version()
+
+
+@receiver(post_save, sender=Recipe)
+def update_recipe_search_vector(sender, instance, **kwargs):
+    Recipe.objects.filter(pk=instance.pk).update_search_vector()
+
+
+@receiver(post_save, sender=Recipe)
+def change_recipe_version(sender, instance, **kwargs):
+    bump_recipe_versions([instance.pk])
+
+
+@receiver(post_save, sender=Recipe)
+def fan_out_recipe(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(lambda: Timeline.objects.fan_out(instance))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def change_recipe_tags_version(sender, instance, action, reverse, pk_set,
+                               **kwargs):
+    if reverse and action == 'pre_clear':
+        recipes = list(instance.recipe_set.values_list('pk', flat=True))
+    elif reverse and action in ('post_add', 'post_remove'):
+        recipes = pk_set
+    elif not reverse and action.startswith('post_'):
+        recipes = [instance.pk]
+    else:
+        return
+    bump_recipe_versions(recipes)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def update_recipe_tags_mask(sender, instance, action, reverse, pk_set,
+                            **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        recipes = Recipe.objects.filter(pk=instance.pk)
+    elif action == 'post_clear':
+        recipes = Recipe.objects.with_tag_bits(instance.mask)
+    else:
+        recipes = Recipe.objects.filter(pk__in=pk_set)
+    recipes.update_tags_mask()
+
+
+@receiver(post_delete, sender=Tag)
+def remove_tag_from_masks(sender, instance, **kwargs):
+    Recipe.objects.with_tag_bits(instance.mask).update_tags_mask()
+
+
+@receiver(post_save, sender=User)
+def change_user_version(sender, instance, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) == {'last_login'}:
+        return
+    bump_user_version(instance.pk)
+
+
+@receiver(post_save, sender=ShoppingCart)
+def add_to_shopping_list(sender, instance, created, **kwargs):
+    if created:
+        ShoppingListItem.objects.refresh(
+            [instance.user_id],
+            IngredientCount.objects.filter(
+                recipe=instance.recipe_id).values('ingredient')
+        )
+
+
+@receiver(pre_delete, sender=ShoppingCart)
+def collect_shopping_list_ingredients(sender, instance, **kwargs):
+    # После каскадного удаления рецепта его ингредиентов уже не будет.
+    instance.shopping_list_ingredients = list(
+        IngredientCount.objects.filter(
+            recipe=instance.recipe_id).values_list('ingredient', flat=True)
+    )
+
+
+@receiver(post_delete, sender=ShoppingCart)
+def remove_from_shopping_list(sender, instance, **kwargs):
+    ShoppingListItem.objects.refresh(
+        [instance.user_id],
+        getattr(instance, 'shopping_list_ingredients', None)
+    )
+
+
+# Счётчики. Пакетные операции менеджеров обновляют их сами,
+# здесь - сохранение и удаление отдельных объектов (админка, каскады).
+COUNTERS = {
+    Favorites: (Recipe, 'recipe_id', 'favorites_count'),
+    Recipe: (User, 'author_id', 'recipes_count'),
+    Subscribe: (User, 'author_id', 'subscribers_count'),
+}
+
+
+@receiver(post_save, sender=Favorites)
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Subscribe)
+def increment_counter(sender, instance, created, **kwargs):
+    if created:
+        model, attname, field = COUNTERS[sender]
+        change_counter(model.objects.filter(pk=getattr(instance, attname)),
+                       field, 1)
+
+
+@receiver(post_delete, sender=Favorites)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Subscribe)
+def decrement_counter(sender, instance, **kwargs):
+    model, attname, field = COUNTERS[sender]
+    change_counter(model.objects.filter(pk=getattr(instance, attname)),
+                   field, -1)
+
+
+# После счётчиков: follow сравнивает с TIMELINE_FANOUT_LIMIT новое
+# число подписчиков.
+@receiver(post_save, sender=Subscribe)
+def follow_author(sender, instance, created, **kwargs):
+    if created:
+        Timeline.objects.follow(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Subscribe)
+def unfollow_author(sender, instance, **kwargs):
+    Timeline.objects.unfollow(instance.user_id, instance.author_id)
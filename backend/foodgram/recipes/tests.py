@@ -0,0 +1,194 @@
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes.models import (Favorites, Ingredient, IngredientCount, Recipe,
+                            ShoppingCart, Tag, User)
+from users.models import Subscribe, Timeline
+
+
+class AdminQueryBudgetTest(TestCase):
+    """Число запросов страниц админки не зависит от числа строк."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='admin')
+        cls.tag = Tag.objects.create(name='Обед', color='#49B64E',
+                                     slug='lunch')
+        cls.ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'Ингредиент {number}', measurement_unit='г')
+            for number in range(12))
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def create_recipes(self, count, ingredients=3):
+        author = User.objects.create_user(
+            username=f'author{User.objects.count()}',
+            email=f'author{User.objects.count()}@example.com')
+        recipes = []
+        for number in range(count):
+            recipe = Recipe.objects.create(
+                author=author, name=f'Рецепт {number}', text='Описание.',
+                cooking_time=10, image='recipes/images/test.jpg')
+            recipe.tags.add(self.tag)
+            IngredientCount.objects.bulk_create(
+                IngredientCount(recipe=recipe, ingredient=ingredient,
+                                amount=10)
+                for ingredient in self.ingredients[:ingredients])
+            Favorites.objects.add(author, recipe.pk)
+            ShoppingCart.objects.add(author, recipe.pk)
+            Subscribe.objects.add(author, self.admin.pk)
+            recipes.append(recipe)
+        return recipes
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        return len(queries)
+
+    def test_changelists(self):
+        urls = [reverse(f'admin:{app}_{model}_changelist')
+                for app, model in (
+                    ('recipes', 'recipe'), ('recipes', 'ingredient'),
+                    ('recipes', 'tag'), ('recipes', 'ingredientcount'),
+                    ('recipes', 'favorites'), ('recipes', 'shoppingcart'),
+                    ('users', 'user'), ('users', 'subscribe'))]
+        self.create_recipes(2)
+        before = {url: self.count_queries(url) for url in urls}
+        self.create_recipes(10)
+        for url in urls:
+            self.assertEqual(self.count_queries(url), before[url], url)
+
+    def test_recipe_change_page(self):
+        small, = self.create_recipes(1, ingredients=3)
+        large, = self.create_recipes(1, ingredients=12)
+        # Первый запрос заполняет кэш ContentType.
+        self.count_queries(
+            reverse('admin:recipes_recipe_change', args=[small.pk]))
+        self.assertEqual(
+            self.count_queries(
+                reverse('admin:recipes_recipe_change', args=[large.pk])),
+            self.count_queries(
+                reverse('admin:recipes_recipe_change', args=[small.pk])))
+
+
+class CounterSaveTest(TestCase):
+    """save() устаревшего объекта не перезаписывает счётчики."""
+
+    def setUp(self):
+        self.author = User.objects.create_user(
+            username='author', email='author@example.com')
+        self.reader = User.objects.create_user(
+            username='reader', email='reader@example.com')
+        self.recipe = Recipe.objects.create(
+            author=self.author, name='Рецепт', text='Описание.',
+            cooking_time=10, image='recipes/images/test.jpg')
+
+    def test_recipe_favorites_count(self):
+        stale = Recipe.objects.get(pk=self.recipe.pk)
+        Favorites.objects.add(self.reader, self.recipe.pk)
+        stale.name = 'Новое название'
+        stale.save()
+        stale.refresh_from_db()
+        self.assertEqual(stale.favorites_count, 1)
+        self.assertEqual(stale.name, 'Новое название')
+
+    def test_user_counters(self):
+        stale = User.objects.get(pk=self.author.pk)
+        Subscribe.objects.add(self.reader, self.author.pk)
+        stale.set_password('new-password')
+        stale.save()
+        stale.refresh_from_db()
+        self.assertEqual(stale.subscribers_count, 1)
+        self.assertEqual(stale.recipes_count, 1)
+        self.assertTrue(stale.check_password('new-password'))
+
+
+class RecipeTagsUpdateTest(TestCase):
+    """Фильтр по тегам видит теги, заданные при изменении рецепта."""
+
+    def setUp(self):
+        self.author = User.objects.create_user(
+            username='author', email='author@example.com')
+        self.breakfast, self.lunch = (
+            Tag.objects.create(name=name, color='#49B64E', slug=slug)
+            for name, slug in (('Завтрак', 'breakfast'), ('Обед', 'lunch')))
+        self.ingredient = Ingredient.objects.create(name='Соль',
+                                                    measurement_unit='г')
+        self.recipe = Recipe.objects.create(
+            author=self.author, name='Рецепт', text='Описание.',
+            cooking_time=10, image='recipes/images/test.jpg')
+        self.recipe.tags.add(self.breakfast)
+        token = Token.objects.create(user=self.author)
+        self.client = APIClient(HTTP_HOST='localhost')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+
+    def filtered(self, slug):
+        response = self.client.get(f'/api/recipes/?tags={slug}')
+        self.assertEqual(response.status_code, 200)
+        return [recipe['id'] for recipe in response.json()['results']]
+
+    def test_patch_tags(self):
+        response = self.client.patch(
+            f'/api/recipes/{self.recipe.pk}/',
+            {'tags': [self.lunch.pk],
+             'ingredients': [{'id': self.ingredient.pk, 'amount': 5}],
+             'name': 'Рецепт', 'text': 'Описание.', 'cooking_time': 10},
+            format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(self.filtered('lunch'), [self.recipe.pk])
+        self.assertEqual(self.filtered('breakfast'), [])
+
+    def test_stale_save(self):
+        stale = Recipe.objects.get(pk=self.recipe.pk)
+        self.recipe.tags.set([self.lunch])
+        stale.name = 'Новое название'
+        stale.save()
+        self.assertEqual(self.filtered('lunch'), [self.recipe.pk])
+        self.assertEqual(self.filtered('breakfast'), [])
+
+
+class TimelineCatchUpTest(TestCase):
+    """Пропущенные рассылкой рецепты видны в ленте и дописываются."""
+
+    def setUp(self):
+        self.enterContext(mock.patch('users.models.TIMELINE_FANOUT_LIMIT', 1))
+        self.author, self.reader, self.other = (
+            User.objects.create_user(username=name,
+                                     email=f'{name}@example.com')
+            for name in ('author', 'reader', 'other'))
+        Subscribe.objects.add(self.reader, self.author.pk)
+        Subscribe.objects.add(self.other, self.author.pk)
+
+    def test_author_below_limit_again(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe = Recipe.objects.create(
+                author=self.author, name='Рецепт', text='Описание.',
+                cooking_time=10, image='recipes/images/test.jpg')
+        self.assertFalse(Timeline.objects.exists())
+        Subscribe.objects.remove(self.other, self.author.pk)
+        self.assertEqual(Timeline.objects.page(self.reader, 10),
+                         [(recipe.pub_date, recipe.pk)])
+        call_command('rebuild_timelines', stdout=StringIO())
+        self.author.refresh_from_db()
+        self.assertFalse(self.author.timeline_pending)
+        self.assertEqual(Timeline.objects.page(self.reader, 10),
+                         [(recipe.pub_date, recipe.pk)])
+        self.assertEqual(
+            list(Timeline.objects.values_list('user', 'recipe')),
+            [(self.reader.pk, recipe.pk)])
+
+    def test_popular_author_stays_pending(self):
+        call_command('rebuild_timelines', stdout=StringIO())
+        self.author.refresh_from_db()
+        self.assertTrue(self.author.timeline_pending)
@@ -0,0 +1,73 @@
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+CATALOG_VERSION_KEY = 'catalog_version'
+
+
+def recipe_version_key(pk):
+    return f'recipe_version:{pk}'
+
+
+def user_version_key(pk):
+    return f'user_version:{pk}'
+
+
+def get_versions(keys):
+    """Текущие версии для ключей кэша одним обращением.
+
+    Отсутствующие версии заводятся от текущего времени, чтобы после
+    вытеснения ключа из кэша значения не повторялись.
+    """
+    versions = cache.get_many(keys)
+    missing = [key for key in keys if key not in versions]
+    for key in missing:
+        cache.add(key, time.time_ns(), timeout=None)
+    if missing:
+        versions.update(cache.get_many(missing))
+    return versions
+
+
+async def aget_versions(keys):
+    """get_versions для async view."""
+    versions = await cache.aget_many(keys)
+    missing = [key for key in keys if key not in versions]
+    for key in missing:
+        await cache.aadd(key, time.time_ns(), timeout=None)
+    if missing:
+        versions.update(await cache.aget_many(missing))
+    return versions
+
+
+def bump_versions(keys):
+    """Увеличение версий после фиксации текущей транзакции."""
+    def bump():
+        for key in keys:
+            try:
+                cache.incr(key)
+            except ValueError:
+                pass
+    transaction.on_commit(bump)
+
+
+def get_catalog_version():
+    """Текущая версия справочников (теги и ингредиенты)."""
+    return get_versions([CATALOG_VERSION_KEY])[CATALOG_VERSION_KEY]
+
+
+async def aget_catalog_version():
+    versions = await aget_versions([CATALOG_VERSION_KEY])
+    return versions[CATALOG_VERSION_KEY]
+
+
+def bump_catalog_version():
+    bump_versions([CATALOG_VERSION_KEY])
+
+
+def bump_recipe_versions(pks):
+    bump_versions([recipe_version_key(pk) for pk in pks])
+
+
+def bump_user_version(pk):
+    bump_versions([user_version_key(pk)])
@@ -1,5 +1,6 @@
 from django.contrib import admin
 
+from recipes.admin import LinkAdmin
 from recipes.models import User
 from users.models import Subscribe
 
@@ -12,15 +13,20 @@ class UserAdmin(admin.ModelAdmin):
         'first_name',
         'last_name',
         'email',
-        'password'
+        'password',
+        'recipes_count',
+        'subscribers_count',
     )
-    list_filter = ('username', 'email')
+    list_filter = ('is_staff', 'is_active')
     search_fields = ('username', 'email')
+    show_full_result_count = False
     empty_value_display = '-пусто-'
 
 
 @admin.register(Subscribe)
-class SubscribeAdmin(admin.ModelAdmin):
+class SubscribeAdmin(LinkAdmin):
     list_display = ('pk', 'user', 'author',)
-    list_editable = ('user', 'author')
+    list_select_related = ('user', 'author')
+    autocomplete_fields = ('user', 'author')
+    search_fields = ('user__username', 'author__username')
     empty_value_display = '-пусто-'
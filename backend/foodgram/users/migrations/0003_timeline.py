@@ -0,0 +1,62 @@
+# Generated by Django 4.2 on 2026-10-18 02:54
+
+from itertools import islice
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+from foodgram.settings import TIMELINE_BATCH_SIZE, TIMELINE_FANOUT_LIMIT
+
+
+def fill_timelines(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Timeline = apps.get_model('users', 'Timeline')
+    db = schema_editor.connection.alias
+    rows = (Recipe.objects.using(db)
+            .filter(author__subscribers_count__lte=TIMELINE_FANOUT_LIMIT,
+                    author__subscribing__isnull=False)
+            .order_by()
+            .values_list('author__subscribing__user', 'pk', 'author',
+                         'pub_date')
+            .iterator(chunk_size=TIMELINE_BATCH_SIZE))
+    while batch := list(islice(rows, TIMELINE_BATCH_SIZE)):
+        Timeline.objects.using(db).bulk_create(
+            Timeline(user_id=user, recipe_id=recipe, author_id=author,
+                     pub_date=pub_date)
+            for user, recipe, author, pub_date in batch
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_tag_mask'),
+        ('users', '0002_user_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Timeline',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pub_date', models.DateTimeField(verbose_name='Дата публикации')),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline', to='recipes.recipe', verbose_name='Рецепт')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline', to=settings.AUTH_USER_MODEL, verbose_name='Подписчик')),
+            ],
+            options={
+                'verbose_name': 'Лента подписок',
+                'verbose_name_plural': 'Ленты подписок',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='timeline',
+            index=models.Index(fields=['user', '-pub_date', '-recipe'], name='timeline_page'),
+        ),
+        migrations.AddConstraint(
+            model_name='timeline',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_timeline_recipe'),
+        ),
+        migrations.RunPython(fill_timelines, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2 on 2026-10-18 03:26
+
+from django.db import migrations, models
+
+# Прежний порог, выше которого рецепты автора читались при запросе
+# ленты: у таких авторов могли быть пропуски в лентах.
+TIMELINE_PULL_LIMIT = 9000
+
+
+def mark_pending(apps, schema_editor):
+    User = apps.get_model('users', 'User')
+    User.objects.using(schema_editor.connection.alias).filter(
+        subscribers_count__gt=TIMELINE_PULL_LIMIT,
+    ).update(timeline_pending=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_timeline'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='timeline_pending',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Рецепты не разосланы в ленты'),
+        ),
+        migrations.RunPython(mark_pending, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,13 @@
+from itertools import islice
+
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import RegexValidator
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Q
 
-from foodgram.settings import REGEX_VALID_USERNAME
+from foodgram.db import change_counter, delete_links, insert_link, save_fields
+from foodgram.settings import (REGEX_VALID_USERNAME, TIMELINE_BATCH_SIZE,
+                               TIMELINE_FANOUT_LIMIT)
 
 
 class User(AbstractUser):
@@ -22,11 +27,30 @@ class User(AbstractUser):
         verbose_name='Адрес электронной почты',
         help_text='Введите свой электронный адрес'
     )
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Рецептов',
+    )
+    subscribers_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Подписчиков',
+    )
+    timeline_pending = models.BooleanField(
+        default=False,
+        editable=False,
+        verbose_name='Рецепты не разосланы в ленты',
+    )
     USERNAME_FIELD = 'email'
 
     REQUIRED_FIELDS = ('username', 'first_name',
                        'last_name')
 
+    # Меняются только запросами UPDATE, save() их не перезаписывает.
+    derived_fields = ('recipes_count', 'subscribers_count',
+                      'timeline_pending')
+
     class Meta:
         verbose_name = 'Пользователь'
         verbose_name_plural = 'Пользователи'
@@ -41,6 +65,37 @@ class User(AbstractUser):
     def __str__(self):
         return self.username
 
+    def save(self, *args, **kwargs):
+        kwargs['update_fields'] = save_fields(
+            self, self.derived_fields, kwargs.get('update_fields'))
+        super().save(*args, **kwargs)
+
+
+class SubscribeQuerySet(models.QuerySet):
+    def add(self, user, author_id):
+        """Подписывает на автора, повтор не считается ошибкой.
+
+        Возвращает автора с атрибутом created или None, если его нет.
+        """
+        with transaction.atomic(using=self.db):
+            author = insert_link(self, user, 'author', author_id)
+            if author is not None and author.created:
+                change_counter(User.objects.filter(pk=author.pk),
+                               'subscribers_count', 1)
+                Timeline.objects.follow(user.pk, author.pk)
+        return author
+
+    def remove(self, user, author_id):
+        """Отписывает от автора. Возвращает, была ли подписка."""
+        with transaction.atomic(using=self.db):
+            removed = delete_links(
+                self.filter(user=user, author_id=author_id), 'author')
+            if removed:
+                change_counter(User.objects.filter(pk__in=removed),
+                               'subscribers_count', -1)
+                Timeline.objects.unfollow(user.pk, author_id)
+        return bool(removed)
+
 
 class Subscribe(models.Model):
     user = models.ForeignKey(
@@ -56,6 +111,8 @@ class Subscribe(models.Model):
         verbose_name='Подписан'
     )
 
+    objects = SubscribeQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Подписка на авторов'
         verbose_name_plural = 'Подписки на авторов'
@@ -65,3 +122,144 @@ class Subscribe(models.Model):
                 name='unique_subscribe'
             )
         ]
+
+
+class TimelineQuerySet(models.QuerySet):
+    """Лента рецептов авторов, на которых подписан пользователь.
+
+    Рецепт записывается в ленты подписчиков при публикации. Если у
+    автора больше TIMELINE_FANOUT_LIMIT подписчиков, рецепт (или при
+    подписке - все его рецепты) в ленты не пишется, а автор получает
+    timeline_pending. Рецепты таких авторов дочитываются из Recipe при
+    запросе страницы, пока rebuild_timelines не допишет их в ленты.
+    """
+
+    def recipes(self):
+        return self.model._meta.get_field('recipe').related_model.objects
+
+    def add_entries(self, rows):
+        """Записи из (user_id, recipe_id, author_id, pub_date) пачками."""
+        rows = iter(rows)
+        while batch := list(islice(rows, TIMELINE_BATCH_SIZE)):
+            self.bulk_create(
+                (self.model(user_id=user, recipe_id=recipe,
+                            author_id=author, pub_date=pub_date)
+                 for user, recipe, author, pub_date in batch),
+                ignore_conflicts=True,
+            )
+
+    @staticmethod
+    def skip_popular(author_id):
+        """Отмечает автора, если он популярнее TIMELINE_FANOUT_LIMIT."""
+        return bool(User.objects.filter(
+            pk=author_id, subscribers_count__gt=TIMELINE_FANOUT_LIMIT,
+        ).update(timeline_pending=True))
+
+    def fan_out(self, recipe):
+        """Рецепт в ленты подписчиков автора."""
+        if self.skip_popular(recipe.author_id):
+            return
+        subscribers = (Subscribe.objects.filter(author=recipe.author_id)
+                       .order_by('user').values_list('user', flat=True)
+                       .iterator(chunk_size=TIMELINE_BATCH_SIZE))
+        self.add_entries((user, recipe.pk, recipe.author_id,
+                          recipe.pub_date) for user in subscribers)
+
+    def fill(self, subscriptions):
+        """Все рецепты авторов из subscriptions в ленты подписчиков."""
+        self.add_entries(
+            self.recipes()
+            .filter(author__subscribing__in=subscriptions,
+                    author__subscribers_count__lte=TIMELINE_FANOUT_LIMIT)
+            .order_by()
+            .values_list('author__subscribing__user', 'pk', 'author',
+                         'pub_date')
+            .iterator(chunk_size=TIMELINE_BATCH_SIZE)
+        )
+
+    def catch_up(self, author_ids):
+        """Дописывает в ленты рецепты авторов и снимает timeline_pending.
+
+        Авторы, у которых всё ещё больше TIMELINE_FANOUT_LIMIT
+        подписчиков, пропускаются. Возвращает число дописанных авторов.
+        """
+        done = 0
+        for author_id in author_ids:
+            # Флаг снимается в одной транзакции с записью ленты: если
+            # рассылку пропустят снова, флаг останется до следующего раза.
+            with transaction.atomic(using=self.db):
+                if User.objects.filter(
+                        pk=author_id,
+                        subscribers_count__lte=TIMELINE_FANOUT_LIMIT,
+                ).update(timeline_pending=False):
+                    self.fill(Subscribe.objects.filter(author=author_id))
+                    done += 1
+        return done
+
+    def follow(self, user_id, author_id):
+        if not self.skip_popular(author_id):
+            self.fill(Subscribe.objects.filter(user=user_id,
+                                               author=author_id))
+
+    def unfollow(self, user_id, author_id):
+        self.filter(user=user_id, author=author_id).delete()
+
+    def page(self, user, limit, before=None):
+        """До limit пар (pub_date, recipe_id) от новых к старым.
+
+        before - пара, после которой продолжается лента.
+        """
+        pushed = self.filter(user=user)
+        pulled = self.recipes().filter(
+            author__subscribing__user=user, author__timeline_pending=True)
+        if before is not None:
+            pub_date, recipe = before
+            pushed = pushed.filter(
+                Q(pub_date__lt=pub_date)
+                | Q(pub_date=pub_date, recipe__lt=recipe))
+            pulled = pulled.filter(
+                Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, pk__lt=recipe))
+        pushed = pushed.order_by('-pub_date', '-recipe').values_list(
+            'pub_date', 'recipe')[:limit]
+        pulled = pulled.order_by('-pub_date', '-pk').values_list(
+            'pub_date', 'pk')[:limit]
+        # Часть рецептов автора могла попасть в ленту до пропуска.
+        return sorted(set(pushed) | set(pulled), reverse=True)[:limit]
+
+
+class Timeline(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Подписчик'
+    )
+    recipe = models.ForeignKey(
+        'recipes.Recipe',
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Рецепт'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор'
+    )
+    pub_date = models.DateTimeField(verbose_name='Дата публикации')
+
+    objects = TimelineQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Лента подписок'
+        verbose_name_plural = 'Ленты подписок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_timeline_recipe'
+            )
+        ]
+        indexes = [
+            models.Index(fields=['user', '-pub_date', '-recipe'],
+                         name='timeline_page'),
+        ]
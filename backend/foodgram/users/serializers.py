@@ -4,6 +4,7 @@ from djoser.serializers import UserSerializer
 from rest_framework import serializers
 
 from users.models import User
+from users.viewer import viewer_ids
 
 
 class UserViewSerializer(UserSerializer):
@@ -11,16 +12,14 @@ class UserViewSerializer(UserSerializer):
     is_subscribed = serializers.SerializerMethodField()
 
     def get_is_subscribed(self, obj):
-        if (self.context.get('request')
-                and not self.context['request'].user.is_anonymous):
-            user = self.context['request'].user
-            return user.subscriber.filter(author=obj).exists()
-        return False
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+        return obj.pk in viewer_ids(self.context, 'subscriptions')
 
     class Meta:
         model = User
         fields = ('email', 'id', 'username', 'first_name',
-                  'last_name', 'is_subscribed', 'password')
+                  'last_name', 'is_subscribed')
 
 
 class PasswordSerializer(serializers.Serializer):
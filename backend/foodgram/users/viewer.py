@@ -0,0 +1,24 @@
+VIEWER_RELATIONS = {
+    'subscriptions': ('subscriber', 'author_id'),
+    'favorites': ('favorite_user', 'recipe_id'),
+    'shopping_cart': ('shopping_list', 'recipe_id'),
+}
+
+
+def viewer_ids(context, relation):
+    """id авторов или рецептов, связанных с текущим пользователем.
+
+    Загружаются одним запросом и запоминаются в запросе, поэтому
+    общие для всех сериализаторов, получивших его в контексте.
+    """
+    request = context.get('request')
+    if request is None or not request.user.is_authenticated:
+        return frozenset()
+    cached = getattr(request, 'viewer_ids', None)
+    if cached is None:
+        cached = request.viewer_ids = {}
+    if relation not in cached:
+        related_name, field = VIEWER_RELATIONS[relation]
+        cached[relation] = frozenset(
+            getattr(request.user, related_name).values_list(field, flat=True))
+    return cached[relation]